@@ -0,0 +1,212 @@
+import http.client
+import json
+import secrets
+import threading
+import time
+
+
+DEFAULT_POLL_INTERVAL = 1.0
+# Stop polling when nobody has asked for traffic data for this long
+IDLE_AFTER = 15.0
+
+
+def controller_from_config(config):
+    """(host, port, secret) of the config's clash_api controller, or None"""
+    clash = (config.get("experimental") or {}).get("clash_api")
+    if not isinstance(clash, dict) or not clash.get("external_controller"):
+        return None
+    host, _, raw_port = str(clash["external_controller"]).rpartition(":")
+    host = host.strip("[]") or "127.0.0.1"
+    if host in ("0.0.0.0", "::"):
+        host = "127.0.0.1"
+    try:
+        port = int(raw_port)
+    except ValueError:
+        return None
+    return host, port, clash.get("secret") or None
+
+
+def enable_clash_api(config, port, secret=None):
+    """Point experimental.clash_api at 127.0.0.1:`port`; returns the secret in use"""
+    secret = secret or secrets.token_hex(16)
+    clash = config.setdefault("experimental", {}).setdefault("clash_api", {})
+    clash["external_controller"] = f"127.0.0.1:{port}"
+    clash["secret"] = secret
+    return secret
+
+
+class ClashApiClient:
+    """Minimal clash_api client reusing one keep-alive HTTP connection"""
+
+    def __init__(self, host, port, secret=None, timeout=3):
+        self.host = host
+        self.port = port
+        self.secret = secret
+        self.timeout = timeout
+        self._conn = None
+
+    def _headers(self):
+        headers = {"Accept": "application/json"}
+        if self.secret:
+            headers["Authorization"] = f"Bearer {self.secret}"
+        return headers
+
+    def get_json(self, path):
+        for attempt in (0, 1):
+            if self._conn is None:
+                self._conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            try:
+                self._conn.request("GET", path, headers=self._headers())
+                resp = self._conn.getresponse()
+                body = resp.read()
+            except (OSError, http.client.HTTPException):
+                # Stale keep-alive connection: reconnect once
+                self.close()
+                if attempt:
+                    raise
+                continue
+            if resp.status != 200:
+                raise RuntimeError(f"clash_api {path} returned HTTP {resp.status}")
+            return json.loads(body)
+
+    def close(self):
+        if self._conn is not None:
+            try:
+                self._conn.close()
+            except Exception:
+                pass
+            self._conn = None
+
+
+class TrafficMonitor:
+    """Aggregates clash_api connection data into per-outbound throughput.
+
+    Every connection is attributed to each outbound in its chain, so a
+    multi-hop connection shows up on all the nodes it passes through.
+    """
+
+    def __init__(self, interval=DEFAULT_POLL_INTERVAL, client_factory=ClashApiClient):
+        self.interval = interval
+        self.client_factory = client_factory
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._client = None
+        self._aliases = {}
+        self._last_access = 0.0
+        self._reset()
+
+    def _reset(self):
+        self._prev = {}  # connection id -> (upload, download)
+        self._prev_totals = None
+        self._prev_time = None
+        self._totals = {}  # tag -> [upload, download]
+        self._snapshot = {"available": False, "updated": None, "total": None, "outbounds": {}, "error": None}
+
+    def start(self, host, port, secret=None, aliases=None):
+        """Attach to a controller; `aliases` maps internal outbound tags to editor tags"""
+        self.stop()
+        with self._lock:
+            self._reset()
+            self._aliases = dict(aliases or {})
+            self._client = self.client_factory(host, port, secret)
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        with self._lock:
+            thread = self._thread
+            self._thread = None
+            self._stop.set()
+            self._wake.set()
+        if thread:
+            thread.join(timeout=2)
+        with self._lock:
+            if self._client:
+                self._client.close()
+                self._client = None
+            self._reset()
+
+    def snapshot(self):
+        """Latest aggregated stats; also keeps the poller awake"""
+        self._last_access = time.monotonic()
+        self._wake.set()
+        with self._lock:
+            return json.loads(json.dumps(self._snapshot))
+
+    def _run(self):
+        while not self._stop.is_set():
+            if time.monotonic() - self._last_access > IDLE_AFTER:
+                # Nobody is looking: sleep until the next snapshot() call
+                self._wake.clear()
+                self._wake.wait()
+                with self._lock:
+                    self._prev_time = None
+                continue
+            try:
+                data = self._client.get_json("/connections")
+                self._ingest(data, time.monotonic())
+            except Exception as e:
+                with self._lock:
+                    self._snapshot["available"] = False
+                    self._snapshot["error"] = str(e)
+            self._stop.wait(self.interval)
+
+    def _ingest(self, data, now):
+        conns = data.get("connections") or []
+        with self._lock:
+            dt = (now - self._prev_time) if self._prev_time else None
+            current = {}
+            per_tag = {}
+            for c in conns:
+                cid = c.get("id")
+                up = int(c.get("upload") or 0)
+                down = int(c.get("download") or 0)
+                current[cid] = (up, down)
+                prev_up, prev_down = self._prev.get(cid, (0, 0)) if dt else (up, down)
+                d_up = max(0, up - prev_up)
+                d_down = max(0, down - prev_down)
+                for raw_tag in set(c.get("chains") or []):
+                    tag = self._aliases.get(raw_tag, raw_tag)
+                    entry = per_tag.setdefault(tag, {"connections": 0, "up": 0, "down": 0})
+                    entry["connections"] += 1
+                    entry["up"] += d_up
+                    entry["down"] += d_down
+                    totals = self._totals.setdefault(tag, [0, 0])
+                    totals[0] += d_up
+                    totals[1] += d_down
+
+            outbounds = {}
+            for tag, totals in self._totals.items():
+                entry = per_tag.get(tag, {"connections": 0, "up": 0, "down": 0})
+                outbounds[tag] = {
+                    "connections": entry["connections"],
+                    "up_bps": round(entry["up"] / dt) if dt else 0,
+                    "down_bps": round(entry["down"] / dt) if dt else 0,
+                    "upload": totals[0],
+                    "download": totals[1],
+                }
+            for tag, entry in per_tag.items():
+                outbounds.setdefault(tag, {
+                    "connections": entry["connections"], "up_bps": 0, "down_bps": 0, "upload": 0, "download": 0
+                })
+
+            up_total = int(data.get("uploadTotal") or 0)
+            down_total = int(data.get("downloadTotal") or 0)
+            total = {"connections": len(conns), "upload": up_total, "download": down_total, "up_bps": 0, "down_bps": 0}
+            if dt and self._prev_totals:
+                total["up_bps"] = round(max(0, up_total - self._prev_totals[0]) / dt)
+                total["down_bps"] = round(max(0, down_total - self._prev_totals[1]) / dt)
+
+            self._prev = current
+            self._prev_totals = (up_total, down_total)
+            self._prev_time = now
+            self._snapshot = {
+                "available": True,
+                "updated": time.time(),
+                "total": total,
+                "outbounds": outbounds,
+                "error": None
+            }
@@ -1,8 +1,153 @@
+import gzip
+import hashlib
+import io
 import json
 import os
 import subprocess
 import tempfile
-import shutil
+import threading
+import time
+from collections import OrderedDict
+
+import metrics
+from diagnostics import PhaseTimer
+
+
+DEFAULT_PROFILE = {
+    "inbounds": [
+        {
+            "tag": "mixed-10808",
+            "type": "mixed",
+            "port": 10808,
+            "detours": [],
+            "selectorDefault": None
+        }
+    ],
+    "nodeLibrary": [
+        { "id": "lib-direct", "tag": "direct", "type": "direct" }
+    ],
+    "layers": [
+        {
+            "id": "layer-1",
+            "title": "HOP 1",
+            "nodes": []
+        }
+    ]
+}
+
+
+# Profile file formats: 'pretty' (indent=2), 'compact' (no whitespace), 'gzip' (compact + gzip)
+PROFILE_FORMATS = ('pretty', 'compact', 'gzip')
+GZIP_MAGIC = b"\x1f\x8b"
+
+
+def gzip_bytes(data, compresslevel=6):
+    """gzip `data` with mtime=0 so identical input gives identical output.
+
+    gzip.compress() only takes mtime from Python 3.8, so write through GzipFile.
+    """
+    buf = io.BytesIO()
+    with gzip.GzipFile(fileobj=buf, mode="wb", compresslevel=compresslevel, mtime=0) as f:
+        f.write(data)
+    return buf.getvalue()
+
+
+def encode_json(data, fmt='pretty'):
+    """Serialize `data` to bytes in one of PROFILE_FORMATS"""
+    if fmt not in PROFILE_FORMATS:
+        raise ValueError(f"Unknown JSON format: {fmt}")
+    if fmt == 'pretty':
+        payload = json.dumps(data, indent=2).encode('utf-8')
+    else:
+        payload = json.dumps(data, separators=(',', ':')).encode('utf-8')
+    if fmt == 'gzip':
+        payload = gzip_bytes(payload)
+    return payload
+
+
+def write_json_atomic(path, data, fmt='pretty'):
+    """Write JSON via temp file + fsync + rename so readers never see a partial file"""
+    payload = encode_json(data, fmt)
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+
+    fd, tmp_path = tempfile.mkstemp(prefix=".tmp-", suffix=".json", dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as tmp:
+            tmp.write(payload)
+            tmp.flush()
+            os.fsync(tmp.fileno())
+        os.replace(tmp_path, path)
+    except Exception:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+    _fsync_dir(directory)
+    return len(payload)
+
+
+def _fsync_dir(directory):
+    """Persist a rename by syncing its directory (not supported on Windows)"""
+    if os.name == 'nt':
+        return
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def read_json_file(path):
+    """Load JSON from plain or gzip-compressed files"""
+    with open(path, 'rb') as f:
+        raw = f.read()
+    if raw[:2] == GZIP_MAGIC:
+        raw = gzip.decompress(raw)
+    return json.loads(raw.decode('utf-8'))
+
+
+# `sing-box check` outcomes keyed by config bytes + binary identity; the same
+# config is typically checked on save and again on start
+CHECK_CACHE_SIZE = 32
+_check_cache = OrderedDict()
+_check_cache_lock = threading.Lock()
+
+CHECK_DURATION = metrics.histogram(
+    "singbox_check_duration_seconds", "Duration of sing-box check runs", ("result",)
+)
+CHECK_CACHE_LOOKUPS = metrics.counter(
+    "singbox_check_cache_lookups_total", "sing-box check result cache lookups", ("result",)
+)
+
+# Top-level key the editor adds to compiled configs for backend-only settings
+# (e.g. round-robin balance modes); stripped before sing-box ever sees the config
+RR_META_KEY = '_sys_rr'
+RR_META_FILENAME = 'rr-meta.json'
+
+
+def rr_meta_path(config_path):
+    return os.path.join(os.path.dirname(config_path), RR_META_FILENAME)
+
+
+def load_rr_meta(config_path):
+    """Per-group RR options saved next to the config ({group_id: {...}})"""
+    path = rr_meta_path(config_path)
+    if not os.path.exists(path):
+        return {}
+    try:
+        meta = read_json_file(path)
+    except Exception as e:
+        print(f"Warning: ignoring unreadable {path}: {e}")
+        return {}
+    groups = meta.get("groups") if isinstance(meta, dict) else None
+    return groups if isinstance(groups, dict) else {}
 
 
 def get_singbox_env():
@@ -12,11 +157,35 @@ def get_singbox_env():
     return env
 
 
+def _check_cache_key(config_path, bin_path):
+    st = os.stat(bin_path)
+    h = hashlib.sha256()
+    h.update(f"{os.path.abspath(bin_path)}:{st.st_mtime_ns}:{st.st_size}\0".encode("utf-8"))
+    with open(config_path, "rb") as f:
+        h.update(f.read())
+    return h.hexdigest()
+
+
 def run_singbox_check(config_path, bin_path):
-    """Validate sing-box configuration"""
+    """Validate sing-box configuration (results are cached per config content)"""
     if not os.path.exists(bin_path):
         return False, f"Binary missing at {bin_path}"
+    try:
+        key = _check_cache_key(config_path, bin_path)
+    except OSError:
+        key = None
+    if key is not None:
+        with _check_cache_lock:
+            cached = _check_cache.get(key)
+            if cached is not None:
+                _check_cache.move_to_end(key)
+        if cached is not None:
+            CHECK_CACHE_LOOKUPS.inc("hit")
+            return cached
+        CHECK_CACHE_LOOKUPS.inc("miss")
+
     cmd = [bin_path, "check", "-c", config_path, "--disable-color"]
+    start = time.perf_counter()
     try:
         result = subprocess.run(
             cmd,
@@ -24,13 +193,22 @@ def run_singbox_check(config_path, bin_path):
             text=True,
             env=get_singbox_env()
         )
-        output = (result.stdout or "") + (result.stderr or "")
-        output = output.strip()
-        if result.returncode == 0:
-            return True, output or "sing-box check passed"
-        return False, output or "sing-box check failed"
     except Exception as e:
+        CHECK_DURATION.observe(time.perf_counter() - start, "error")
         return False, str(e)
+    CHECK_DURATION.observe(time.perf_counter() - start, "ok" if result.returncode == 0 else "failed")
+    output = (result.stdout or "") + (result.stderr or "")
+    output = output.strip()
+    if result.returncode == 0:
+        outcome = (True, output or "sing-box check passed")
+    else:
+        outcome = (False, output or "sing-box check failed")
+    if key is not None:
+        with _check_cache_lock:
+            _check_cache[key] = outcome
+            while len(_check_cache) > CHECK_CACHE_SIZE:
+                _check_cache.popitem(last=False)
+    return outcome
 
 
 def ensure_config_exists(config_path):
@@ -54,8 +232,7 @@ def ensure_config_exists(config_path):
             }
         }
 
-        with open(config_path, 'w') as f:
-            json.dump(default_config, f, indent=2)
+        write_json_atomic(config_path, default_config)
 
 
 def ensure_profiles_dir(profiles_dir):
@@ -64,44 +241,36 @@ def ensure_profiles_dir(profiles_dir):
         os.makedirs(profiles_dir)
         default_path = os.path.join(profiles_dir, 'Default.json')
         if not os.path.exists(default_path):
-            with open(default_path, 'w') as f:
-                json.dump({
-                    "inbounds": [
-                        {
-                            "tag": "mixed-10808",
-                            "type": "mixed",
-                            "port": 10808,
-                            "detours": [],
-                            "selectorDefault": None
-                        }
-                    ],
-                    "nodeLibrary": [
-                        { "id": "lib-direct", "tag": "direct", "type": "direct" }
-                    ],
-                    "layers": [
-                        {
-                            "id": "layer-1",
-                            "title": "HOP 1",
-                            "nodes": []
-                        }
-                    ]
-                }, f, indent=2)
-
-
-def save_config(config_data, config_path, bin_path):
-    """Save configuration with validation"""
+            write_json_atomic(default_path, DEFAULT_PROFILE)
+
+
+def save_config(config_data, config_path, bin_path, timer=None):
+    """Save configuration with validation; phases are recorded on `timer` if given"""
+    span = PhaseTimer.span_of(timer)
     try:
+        config_data = dict(config_data)
+        rr_meta = config_data.pop(RR_META_KEY, None)
         os.makedirs(os.path.dirname(config_path), exist_ok=True)
-        fd, tmp_path = tempfile.mkstemp(prefix="config-", suffix=".json", dir=os.path.dirname(config_path))
-        with os.fdopen(fd, 'w') as tmp:
-            json.dump(config_data, tmp, indent=2)
+        with span("write_temp"):
+            fd, tmp_path = tempfile.mkstemp(prefix="config-", suffix=".json", dir=os.path.dirname(config_path))
+            with os.fdopen(fd, 'w') as tmp:
+                json.dump(config_data, tmp, indent=2)
+                tmp.flush()
+                os.fsync(tmp.fileno())
 
-        ok, detail = run_singbox_check(tmp_path, bin_path)
+        with span("check"):
+            ok, detail = run_singbox_check(tmp_path, bin_path)
         if not ok:
             os.unlink(tmp_path)
             return False, "Config validation failed", detail
 
-        shutil.move(tmp_path, config_path)
+        with span("replace"):
+            os.replace(tmp_path, config_path)
+            _fsync_dir(os.path.dirname(config_path))
+            if isinstance(rr_meta, dict):
+                write_json_atomic(rr_meta_path(config_path), rr_meta)
+            elif os.path.exists(rr_meta_path(config_path)):
+                os.unlink(rr_meta_path(config_path))
         return True, "Config saved", detail
     except Exception as e:
         return False, str(e), None
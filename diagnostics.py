@@ -0,0 +1,172 @@
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+
+PROFILE_MODES = ("cprofile", "tracemalloc", "both")
+MAX_PROFILED_REQUESTS = 100
+REPORT_LINES = 40
+
+
+class PhaseTimer:
+    """Named timing spans for one request, in the order they ran"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.spans = []
+
+    @staticmethod
+    def span_of(timer):
+        """`timer.span`, or a no-op span for callers that were given no timer"""
+        return timer.span if timer else (lambda _name: nullcontext())
+
+    @contextmanager
+    def span(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.spans.append((name, (time.perf_counter() - start) * 1000.0))
+
+    def as_dict(self):
+        """{phase: ms}; repeated phases are summed, 'total' covers the whole request so far"""
+        out = {}
+        for name, ms in self.spans:
+            out[name] = round(out.get(name, 0.0) + ms, 2)
+        out["total"] = round((time.perf_counter() - self.started) * 1000.0, 2)
+        return out
+
+    def server_timing(self):
+        """Value for a Server-Timing response header"""
+        return ", ".join(f"{name};dur={ms}" for name, ms in self.as_dict().items())
+
+    def summary(self):
+        return " ".join(f"{name}={ms}ms" for name, ms in self.as_dict().items())
+
+
+class RequestProfiler:
+    """Profiles the next N requests once armed, then writes reports to `out_dir`.
+
+    cProfile stats accumulate over all captured requests; tracemalloc reports
+    the allocation growth between the first and the last of them.
+    """
+
+    def __init__(self, out_dir):
+        self.out_dir = out_dir
+        self._lock = threading.Lock()
+        self._busy = threading.Lock()  # cProfile can only run one capture at a time
+        self._reset()
+        self.last = None
+
+    def _reset(self):
+        self.remaining = 0
+        self.mode = None
+        self._profile = None
+        self._baseline = None
+        self._labels = []
+
+    def arm(self, count, mode="cprofile"):
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"mode must be one of {', '.join(PROFILE_MODES)}")
+        count = int(count)
+        if not 1 <= count <= MAX_PROFILED_REQUESTS:
+            raise ValueError(f"requests must be between 1 and {MAX_PROFILED_REQUESTS}")
+        with self._lock:
+            if self.remaining:
+                raise RuntimeError("A capture is already in progress")
+            self.remaining = count
+            self.mode = mode
+            # The profilers are only imported once a capture is armed, keeping server startup lean
+            if mode in ("cprofile", "both"):
+                import cProfile
+                self._profile = cProfile.Profile()
+            else:
+                self._profile = None
+            if mode in ("tracemalloc", "both"):
+                import tracemalloc
+                if not tracemalloc.is_tracing():
+                    tracemalloc.start(16)
+
+    def status(self):
+        with self._lock:
+            return {
+                "armed": self.remaining > 0,
+                "remaining": self.remaining,
+                "mode": self.mode,
+                "captured": list(self._labels),
+                "last": self.last
+            }
+
+    @contextmanager
+    def capture(self, label):
+        if not self.remaining or not self._busy.acquire(blocking=False):
+            yield
+            return
+        try:
+            with self._lock:
+                active = self.remaining > 0
+                profile = self._profile
+                if active and self.mode in ("tracemalloc", "both") and self._baseline is None:
+                    import tracemalloc
+                    self._baseline = tracemalloc.take_snapshot()
+            if not active:
+                yield
+                return
+            if profile is not None:
+                profile.enable()
+            try:
+                yield
+            finally:
+                if profile is not None:
+                    profile.disable()
+                with self._lock:
+                    self._labels.append(label)
+                    self.remaining -= 1
+                    if self.remaining == 0:
+                        self._finish()
+        finally:
+            self._busy.release()
+
+    def _finish(self):
+        os.makedirs(self.out_dir, exist_ok=True)
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        files = []
+        reports = {}
+
+        if self._profile is not None:
+            import io
+            import pstats
+            prof_path = os.path.join(self.out_dir, f"{stamp}-cprofile.prof")
+            self._profile.dump_stats(prof_path)
+            buf = io.StringIO()
+            pstats.Stats(self._profile, stream=buf).sort_stats("cumulative").print_stats(REPORT_LINES)
+            report = buf.getvalue()
+            files.append(prof_path)
+            files.append(self._write_text(f"{stamp}-cprofile.txt", report))
+            reports["cprofile"] = report
+
+        if self._baseline is not None:
+            import tracemalloc
+            snapshot = tracemalloc.take_snapshot()
+            stats = snapshot.compare_to(self._baseline, "lineno")[:REPORT_LINES]
+            report = "\n".join(str(s) for s in stats) + "\n"
+            files.append(self._write_text(f"{stamp}-tracemalloc.txt", report))
+            reports["tracemalloc"] = report
+            tracemalloc.stop()
+
+        self.last = {
+            "finished": time.time(),
+            "mode": self.mode,
+            "requests": list(self._labels),
+            "files": files,
+            "reports": reports
+        }
+        print(f"Profile of {len(self._labels)} request(s) written: {', '.join(files)}")
+        self._reset()
+
+    def _write_text(self, name, text):
+        path = os.path.join(self.out_dir, name)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+        return path
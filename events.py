@@ -0,0 +1,64 @@
+import json
+import queue
+import threading
+from collections import deque
+
+
+HISTORY_SIZE = 200
+# A subscriber this far behind is dropped; EventSource reconnects and
+# catches up from the history using Last-Event-ID
+SUBSCRIBER_QUEUE_SIZE = 500
+KEEPALIVE_SECONDS = 15
+
+
+def format_sse(event, data, event_id=None):
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event}")
+    for chunk in data.split("\n"):
+        lines.append(f"data: {chunk}")
+    return ("\n".join(lines) + "\n\n").encode("utf-8")
+
+
+class EventBus:
+    """Fans server events out to SSE subscribers, with a short replay history"""
+
+    def __init__(self, history_size=HISTORY_SIZE):
+        self._lock = threading.Lock()
+        self._seq = 0
+        self._history = deque(maxlen=history_size)
+        self._subscribers = set()
+
+    def publish(self, event, data):
+        payload = json.dumps(data)
+        with self._lock:
+            self._seq += 1
+            item = (self._seq, event, payload)
+            self._history.append(item)
+            for q in list(self._subscribers):
+                try:
+                    q.put_nowait(item)
+                except queue.Full:
+                    self._subscribers.discard(q)
+
+    def has_subscribers(self):
+        return bool(self._subscribers)
+
+    def subscribe(self, last_event_id=None):
+        """Return a queue of (id, event, json) items, pre-filled with history newer than `last_event_id`"""
+        q = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        with self._lock:
+            if last_event_id is not None:
+                for item in self._history:
+                    if item[0] > last_event_id:
+                        q.put_nowait(item)
+            self._subscribers.add(q)
+        return q
+
+    def unsubscribe(self, q):
+        with self._lock:
+            self._subscribers.discard(q)
+
+    def is_subscribed(self, q):
+        return q in self._subscribers
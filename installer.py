@@ -1,140 +1,383 @@
+import hashlib
+import json
 import os
 import platform
 import shutil
+import tarfile
+import threading
+import time
+import urllib.error
 import urllib.request
 import zipfile
-import tarfile
 
 # Sing-box installation constants
 DEFAULT_VERSION = "1.12.12"
-ARCH = "amd64"
-BASE_URL = "https://github.com/SagerNet/sing-box/releases/download"
+GITHUB_RELEASES_URL = "https://github.com/SagerNet/sing-box/releases/download"
+# Point at a mirror (same v<version>/<asset> layout) to install from elsewhere
+BASE_URL = os.environ.get("SINGBOX_RELEASE_URL", GITHUB_RELEASES_URL)
+RELEASE_API_URL = "https://api.github.com/repos/SagerNet/sing-box/releases/tags/v{version}"
 DOWNLOAD_MAP = {
     "Windows": {"ext": "zip", "bin_name": "sing-box.exe", "os": "windows"},
     "Linux": {"ext": "tar.gz", "bin_name": "sing-box", "os": "linux"},
     "Darwin": {"ext": "tar.gz", "bin_name": "sing-box", "os": "darwin"},
 }
+# platform.machine() -> sing-box release arch
+ARCH_MAP = {
+    "x86_64": "amd64", "amd64": "amd64",
+    "aarch64": "arm64", "arm64": "arm64",
+    "i386": "386", "i686": "386", "x86": "386",
+    "armv7l": "armv7", "armv7": "armv7",
+    "armv6l": "armv6",
+    "s390x": "s390x",
+    "riscv64": "riscv64",
+}
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3"
+DOWNLOAD_ATTEMPTS = 4
+DOWNLOAD_TIMEOUT = 30
+CHUNK_SIZE = 256 * 1024
+MANIFEST_NAME = "manifest.json"
+# Minimum seconds between download progress notifications of an InstallJob
+PROGRESS_INTERVAL = 0.5
 
 
-def _check_path_traversal(base_dir, target_path):
-    """Check if target path is within base directory to prevent path traversal"""
-    base_dir = os.path.abspath(base_dir)
-    target_path = os.path.abspath(target_path)
-    return os.path.commonpath([base_dir, target_path]) == base_dir
+def detect_arch(machine=None):
+    machine = (machine or platform.machine()).lower()
+    if machine not in ARCH_MAP:
+        raise RuntimeError(f"Unsupported CPU architecture: {machine}")
+    return ARCH_MAP[machine]
 
 
-def _extract_zip_safe(zip_ref, dest_dir):
-    """Safely extract zip file, preventing path traversal attacks"""
-    for info in zip_ref.infolist():
-        out_path = os.path.join(dest_dir, info.filename)
-        if not _check_path_traversal(dest_dir, out_path):
-            raise RuntimeError(f"Blocked zip path traversal: {info.filename}")
-    zip_ref.extractall(dest_dir)
+def get_target(version=DEFAULT_VERSION, system=None, arch=None):
+    """Download details for one version/os/arch; `key` names its cache entry"""
+    system = system or platform.system()
+    if system not in DOWNLOAD_MAP:
+        raise RuntimeError(f"Unsupported operating system: {system}")
+    cfg = DOWNLOAD_MAP[system].copy()
+    cfg["version"] = version
+    cfg["arch"] = arch or detect_arch()
+    cfg["key"] = f"{version}-{cfg['os']}-{cfg['arch']}"
+    cfg["asset"] = f"sing-box-{cfg['key']}.{cfg['ext']}"
+    return cfg
 
 
-def _extract_tar_safe(tar_ref, dest_dir):
-    """Safely extract tar file, preventing symlink attacks"""
-    for member in tar_ref.getmembers():
-        if member.issym() or member.islnk():
-            raise RuntimeError(f"Blocked tar link entry: {member.name}")
-        out_path = os.path.join(dest_dir, member.name)
-        if not _check_path_traversal(dest_dir, out_path):
-            raise RuntimeError(f"Blocked tar path traversal: {member.name}")
-    tar_ref.extractall(dest_dir)
+def _sha256_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
 
 
-def _download_sing_box(url, dest):
-    """Download sing-box archive from GitHub"""
-    print(f"Downloading sing-box from {url}...")
+def fetch_release_sha256(version, asset):
+    """The asset digest GitHub publishes for a release, or None if unavailable"""
+    req = urllib.request.Request(
+        RELEASE_API_URL.format(version=version),
+        headers={'User-Agent': USER_AGENT, 'Accept': 'application/vnd.github+json'}
+    )
     try:
-        # Adding User-Agent because some GitHub releases might reject generic python requests
-        req = urllib.request.Request(
-            url,
-            data=None,
-            headers={
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3'
-            }
-        )
-        with urllib.request.urlopen(req) as response, open(dest, 'wb') as out_file:
-            shutil.copyfileobj(response, out_file)
-        print("Download complete.")
+        with urllib.request.urlopen(req, timeout=10) as response:
+            release = json.load(response)
     except Exception as e:
-        raise RuntimeError(f"Download failed: {e}")
+        print(f"Could not fetch release checksums: {e}")
+        return None
+    for item in release.get("assets") or []:
+        digest = item.get("digest") or ""
+        if item.get("name") == asset and digest.startswith("sha256:"):
+            return digest[len("sha256:"):]
+    return None
+
 
+def _download_sing_box(url, dest, attempts=DOWNLOAD_ATTEMPTS, progress=None):
+    """Download `url` to `dest`, resuming `dest`.part with HTTP Range across retries.
+
+    `progress(received, total)` is called after every chunk; total may be None.
+    """
+    part_path = dest + '.part'
+    print(f"Downloading sing-box from {url}...")
+    last_error = None
+    for attempt in range(1, attempts + 1):
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        headers = {'User-Agent': USER_AGENT}
+        if offset:
+            headers['Range'] = f'bytes={offset}-'
+            print(f"Resuming at {offset} bytes...")
+        try:
+            req = urllib.request.Request(url, headers=headers)
+            with urllib.request.urlopen(req, timeout=DOWNLOAD_TIMEOUT) as response:
+                # A server that ignores Range sends the whole file again
+                resumed = offset and response.status == 206
+                length = response.headers.get('Content-Length')
+                expected_size = (offset if resumed else 0) + int(length) if length else None
+                received = offset if resumed else 0
+                with open(part_path, 'ab' if resumed else 'wb') as out_file:
+                    for chunk in iter(lambda: response.read(CHUNK_SIZE), b''):
+                        out_file.write(chunk)
+                        received += len(chunk)
+                        if progress:
+                            progress(received, expected_size)
+            # A dropped connection ends the body early without raising
+            received = os.path.getsize(part_path)
+            if expected_size is not None and received < expected_size:
+                raise ConnectionError(f"connection closed after {received} of {expected_size} bytes")
+            os.replace(part_path, dest)
+            print("Download complete.")
+            return
+        except urllib.error.HTTPError as e:
+            if e.code == 416 and offset:
+                # Nothing left to fetch: the partial file is already whole
+                os.replace(part_path, dest)
+                return
+            last_error = e
+            if 400 <= e.code < 500 and e.code not in (408, 429):
+                break
+        except Exception as e:
+            last_error = e
+        if attempt < attempts:
+            delay = 2 ** (attempt - 1)
+            print(f"Download attempt {attempt} failed ({last_error}), retrying in {delay}s...")
+            time.sleep(delay)
+    raise RuntimeError(f"Download failed: {last_error}")
 
-def _install_from_archive(archive_path, config, bin_dir, temp_dir):
-    """Extract and install sing-box from archive"""
-    print(f"Extracting {config['ext']} archive...")
 
+def _extract_binary(archive_path, config, dest):
+    """Extract only the sing-box binary member of the archive to `dest`"""
+    print(f"Extracting {config['bin_name']} from {config['ext']} archive...")
     target_bin_name = config['bin_name']  # e.g. sing-box or sing-box.exe
-    extracted_bin_path = None
+    tmp_path = dest + '.tmp'
 
     try:
         if config['ext'] == 'zip':
             with zipfile.ZipFile(archive_path, 'r') as zip_ref:
-                _extract_zip_safe(zip_ref, temp_dir)
-                # Search for the binary
-                for root, dirs, files in os.walk(temp_dir):
-                    if target_bin_name in files:
-                        extracted_bin_path = os.path.join(root, target_bin_name)
-                        break
+                member = next(
+                    (i for i in zip_ref.infolist()
+                     if not i.is_dir() and i.filename.rsplit('/', 1)[-1] == target_bin_name),
+                    None
+                )
+                if member is None:
+                    raise RuntimeError(f"Could not find '{target_bin_name}' in the archive.")
+                with zip_ref.open(member) as src, open(tmp_path, 'wb') as out_file:
+                    shutil.copyfileobj(src, out_file, CHUNK_SIZE)
 
         elif config['ext'] == 'tar.gz':
             with tarfile.open(archive_path, 'r:gz') as tar_ref:
-                _extract_tar_safe(tar_ref, temp_dir)
-                # Search for the binary
-                for root, dirs, files in os.walk(temp_dir):
-                    if target_bin_name in files:
-                        extracted_bin_path = os.path.join(root, target_bin_name)
-                        break
+                # Links and devices are never followed, only a regular file is read
+                member = next(
+                    (m for m in tar_ref if m.isfile() and m.name.rsplit('/', 1)[-1] == target_bin_name),
+                    None
+                )
+                if member is None:
+                    raise RuntimeError(f"Could not find '{target_bin_name}' in the archive.")
+                with tar_ref.extractfile(member) as src, open(tmp_path, 'wb') as out_file:
+                    shutil.copyfileobj(src, out_file, CHUNK_SIZE)
 
-        if not extracted_bin_path:
-            raise RuntimeError(f"Could not find '{target_bin_name}' in the archive.")
+        # chmod +x for Linux/Mac
+        if platform.system() != "Windows":
+            os.chmod(tmp_path, 0o755)
+        os.replace(tmp_path, dest)
 
-        # Prepare destination
-        final_path = os.path.join(bin_dir, target_bin_name)
+    except Exception as e:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise RuntimeError(f"Installation failed: {e}")
 
-        # Remove old version if exists
-        if os.path.exists(final_path):
-            os.remove(final_path)
 
-        # Move to bin
-        shutil.move(extracted_bin_path, final_path)
+def _versions_dir(base_dir):
+    return os.path.join(base_dir, 'bin', 'versions')
 
-        # chmod +x for Linux/Mac
-        if platform.system() != "Windows":
-            os.chmod(final_path, 0o755)
 
-        print(f"Installed {target_bin_name} to {bin_dir}/")
+def activate_version(base_dir, key):
+    """Point bin/<sing-box> at an installed version.
 
-    except Exception as e:
-        raise RuntimeError(f"Installation failed: {e}")
+    The link is swapped with an atomic rename, so a running core or a
+    concurrent start never sees a missing binary. Where symlinks are not
+    available (Windows without developer mode) the binary is copied instead.
+    """
+    version_dir = os.path.join(_versions_dir(base_dir), key)
+    manifest = read_manifest(version_dir)
+    if manifest is None:
+        raise RuntimeError(f"sing-box {key} is not installed")
+    bin_name = manifest["bin_name"]
+    final_path = os.path.join(base_dir, 'bin', bin_name)
+    tmp_link = final_path + '.new'
+    if os.path.lexists(tmp_link):
+        os.remove(tmp_link)
+    try:
+        os.symlink(os.path.join('versions', key, bin_name), tmp_link)
+    except (OSError, NotImplementedError):
+        shutil.copy2(os.path.join(version_dir, bin_name), tmp_link)
+    os.replace(tmp_link, final_path)
+    print(f"Active sing-box version: {key}")
+    return final_path
 
 
-def install_sing_box_core(base_dir):
-    """Main function to install sing-box core"""
-    temp_dir = os.path.join(base_dir, 'temp')
-    bin_dir = os.path.join(base_dir, 'bin')
+def read_manifest(version_dir):
+    try:
+        with open(os.path.join(version_dir, MANIFEST_NAME), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
 
-    # Ensure directories exist
-    os.makedirs(bin_dir, exist_ok=True)
-    os.makedirs(temp_dir, exist_ok=True)
 
-    # Get system configuration
-    system = platform.system()
-    if system not in DOWNLOAD_MAP:
-        raise RuntimeError(f"Unsupported operating system: {system}")
+def list_installed_versions(base_dir):
+    """Manifests of every cached version, with `active` set on the one bin/ points at"""
+    versions_dir = _versions_dir(base_dir)
+    if not os.path.isdir(versions_dir):
+        return []
+    active = None
+    for cfg in DOWNLOAD_MAP.values():
+        link = os.path.join(base_dir, 'bin', cfg['bin_name'])
+        if os.path.islink(link):
+            active = os.path.basename(os.path.dirname(os.readlink(link)))
+    installed = []
+    for key in sorted(os.listdir(versions_dir)):
+        manifest = read_manifest(os.path.join(versions_dir, key))
+        if manifest is not None:
+            installed.append({**manifest, "active": key == active})
+    return installed
 
-    cfg = DOWNLOAD_MAP[system].copy()
-    version = DEFAULT_VERSION
-    cfg["url"] = f"{BASE_URL}/v{version}/sing-box-{version}-{cfg['os']}-{ARCH}.{cfg['ext']}"
 
-    # Download and install
-    archive_path = os.path.join(temp_dir, f"sing-box.{cfg['ext']}")
-    _download_sing_box(cfg["url"], archive_path)
-    _install_from_archive(archive_path, cfg, bin_dir, temp_dir)
+def install_sing_box_core(base_dir, version=DEFAULT_VERSION, sha256=None, base_url=None,
+                          system=None, arch=None, activate=True, progress=None):
+    """Install a sing-box version into bin/versions/ and make it the active binary.
+
+    An already installed version is only re-linked. Archives are kept in
+    temp/downloads/ (keyed by version/os/arch) and resumed if interrupted.
+    `sha256` pins the archive checksum; otherwise the digest GitHub publishes
+    for the release asset is used when the default release URL is in use.
+    `progress(stage, **info)` is told about each step.
+    """
+    report = progress or (lambda stage, **info: None)
+    cfg = get_target(version, system, arch)
+    version_dir = os.path.join(_versions_dir(base_dir), cfg["key"])
+    bin_path = os.path.join(version_dir, cfg["bin_name"])
+
+    cached = read_manifest(version_dir)
+    if cached is not None and os.path.exists(bin_path) and (sha256 is None or cached["sha256"] == sha256.lower()):
+        print(f"sing-box {cfg['key']} found in cache")
+        report("activating", key=cfg["key"])
+        return activate_version(base_dir, cfg["key"]) if activate else bin_path
+
+    download_dir = os.path.join(base_dir, 'temp', 'downloads')
+    os.makedirs(download_dir, exist_ok=True)
+    os.makedirs(version_dir, exist_ok=True)
+
+    base_url = base_url or BASE_URL
+    url = f"{base_url.rstrip('/')}/v{version}/{cfg['asset']}"
+    report("resolving", key=cfg["key"])
+    expected = sha256
+    if expected is None and base_url == GITHUB_RELEASES_URL:
+        expected = fetch_release_sha256(version, cfg["asset"])
+    if expected is None:
+        print("WARNING: no published checksum for this archive; recording its SHA-256 unverified")
+
+    archive_path = os.path.join(download_dir, cfg["asset"])
+    try:
+        if os.path.exists(archive_path) and (expected is None or _sha256_file(archive_path) != expected.lower()):
+            # A cached archive is only trusted when it matches a known checksum
+            os.remove(archive_path)
+        if not os.path.exists(archive_path):
+            report("downloading", key=cfg["key"], received=0, total=None)
+            _download_sing_box(
+                url, archive_path,
+                progress=lambda received, total: report("downloading", key=cfg["key"], received=received, total=total)
+            )
+
+        report("verifying", key=cfg["key"])
+        actual = _sha256_file(archive_path)
+        if expected is not None and actual != expected.lower():
+            os.remove(archive_path)
+            raise RuntimeError(f"Checksum mismatch for {cfg['asset']}: expected {expected}, got {actual}")
+
+        report("extracting", key=cfg["key"])
+        _extract_binary(archive_path, cfg, bin_path)
+    except Exception:
+        if cached is None:
+            shutil.rmtree(version_dir, ignore_errors=True)
+        raise
+    manifest = {
+        "version": version,
+        "os": cfg["os"],
+        "arch": cfg["arch"],
+        "key": cfg["key"],
+        "bin_name": cfg["bin_name"],
+        "url": url,
+        "sha256": actual,
+        "verified": expected is not None,
+        "installed_at": time.time()
+    }
+    tmp_manifest = os.path.join(version_dir, MANIFEST_NAME + '.tmp')
+    with open(tmp_manifest, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_manifest, os.path.join(version_dir, MANIFEST_NAME))
+
+    print(f"Successfully installed sing-box {cfg['key']}")
+    report("activating", key=cfg["key"])
+    return activate_version(base_dir, cfg["key"]) if activate else bin_path
+
+
+class InstallJob:
+    """Runs install_sing_box_core on a background thread and tracks its progress.
+
+    `on_change(status)` is called on every stage change and at most every
+    PROGRESS_INTERVAL seconds while downloading.
+    """
+
+    def __init__(self, base_dir, on_change=None):
+        self.base_dir = base_dir
+        self.on_change = on_change
+        self._lock = threading.Lock()
+        self._thread = None
+        self._last_notify = 0.0
+        self._status = {"state": "idle"}
+
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def status(self):
+        with self._lock:
+            return dict(self._status)
+
+    def start(self, version=None, **kwargs):
+        """Start installing `version`; returns False if an install is already running"""
+        with self._lock:
+            if self.is_running():
+                return False
+            self._status = {
+                "state": "running", "version": version or DEFAULT_VERSION, "stage": "starting",
+                "received": 0, "total": None, "error": None, "path": None,
+                "started": time.time(), "finished": None
+            }
+            self._thread = threading.Thread(
+                target=self._run, args=(version or DEFAULT_VERSION, kwargs), daemon=True
+            )
+            self._thread.start()
+        self._notify(force=True)
+        return True
+
+    def _run(self, version, kwargs):
+        try:
+            path = install_sing_box_core(self.base_dir, version=version, progress=self._progress, **kwargs)
+            self._update(state="done", stage="done", path=path, finished=time.time())
+        except Exception as e:
+            print(f"ERROR: Failed to install sing-box core: {e}")
+            self._update(state="failed", error=str(e), finished=time.time())
+
+    def _progress(self, stage, **info):
+        with self._lock:
+            changed = stage != self._status.get("stage")
+            self._status.update(stage=stage, **info)
+        self._notify(force=changed)
 
-    # Cleanup
-    shutil.rmtree(temp_dir, ignore_errors=True)
+    def _update(self, **changes):
+        with self._lock:
+            self._status.update(changes)
+        self._notify(force=True)
 
-    print(f"Successfully installed sing-box {version}")
\ No newline at end of file
+    def _notify(self, force=False):
+        if not self.on_change:
+            return
+        now = time.monotonic()
+        if not force and now - self._last_notify < PROGRESS_INTERVAL:
+            return
+        self._last_notify = now
+        self.on_change(self.status())
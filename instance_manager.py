@@ -0,0 +1,352 @@
+import os
+import shutil
+import threading
+import time
+
+from clash_api import TrafficMonitor, controller_from_config, enable_clash_api
+from config_handler import (
+    ensure_config_exists,
+    load_rr_meta,
+    read_json_file,
+    run_singbox_check,
+    save_config,
+    write_json_atomic
+)
+from diagnostics import PhaseTimer
+from process_manager import SingBoxProcessManager
+from proxy_manager import RRProxyManager, port_is_free
+
+
+DEFAULT_INSTANCE = "default"
+# How long start waits for a killed core to let go of its ports
+PORT_RELEASE_TIMEOUT = 5
+
+
+def config_listen_ports(config):
+    """Every local port a config's core and RR helpers listen on"""
+    ports = set()
+    for ib in config.get("inbounds") or []:
+        if isinstance(ib, dict) and isinstance(ib.get("listen_port"), int):
+            ports.add(ib["listen_port"])
+    for o in config.get("outbounds") or []:
+        if (isinstance(o, dict) and isinstance(o.get("tag"), str)
+                and o["tag"].startswith(RRProxyManager.RR_PREFIX) and isinstance(o.get("server_port"), int)):
+            ports.add(o["server_port"])
+    controller = controller_from_config(config)
+    if controller:
+        ports.add(controller[1])
+    return ports
+
+
+class CoreInstance:
+    """One sing-box process with its own config, log buffer, RR helpers and traffic monitor"""
+
+    def __init__(self, name, config_path, bin_path, log_path, clash_api=True):
+        self.name = name
+        self.config_path = config_path
+        self.bin_path = bin_path
+        self.clash_api = clash_api
+        self.process_manager = SingBoxProcessManager(bin_path, config_path, log_path)
+        self.rr = RRProxyManager(instance=name)
+        self.traffic = TrafficMonitor()
+        # Serializes start/stop/save of this instance
+        self.lock = threading.Lock()
+        self.listen_ports = set()
+
+    def is_running(self):
+        return self.process_manager.is_running()
+
+    def state(self, **extra):
+        running = self.is_running()
+        return {
+            "instance": self.name,
+            "running": running,
+            "pid": self.process_manager.process.pid if running else None,
+            **extra
+        }
+
+    def status(self):
+        uptime = self.process_manager.uptime()
+        return self.state(
+            uptime=round(uptime, 1) if uptime is not None else None,
+            config_path=self.config_path,
+            ports=sorted(self.listen_ports) if self.is_running() else [],
+            rr_groups=self.rr.status(),
+            rr_limits=RRProxyManager.limits()
+        )
+
+    def save_config(self, config_data, timer=None, reserved=None):
+        """Validate and write this instance's config; returns a JSON-ready result"""
+        span = PhaseTimer.span_of(timer)
+        # While the core runs its own listeners hold the ports, so only check for clashes
+        try:
+            with span('plan_ports'):
+                ports, reservation = self.rr.plan_ports(
+                    config_data, check_free=not self.is_running(), reserved=reserved
+                )
+                try:
+                    if self.clash_api and controller_from_config(config_data) is None:
+                        self._carry_controller(config_data, reservation, reserved or {})
+                finally:
+                    reservation.release()
+        except Exception as e:
+            return {"status": "error", "message": f"Port planning failed: {e}"}
+
+        success, message, detail = save_config(config_data, self.config_path, self.bin_path, timer=timer)
+        return {
+            "status": "success" if success else "error",
+            "message": message,
+            "detail": detail,
+            "ports": ports
+        }
+
+    def _carry_controller(self, config_data, reservation, reserved):
+        """Give a saved config the clash_api controller start() would use.
+
+        The editor's configs never carry one, so without this start() would
+        inject a new port and secret, rewrite the file and miss the check
+        cache on every save-then-start.
+        """
+        try:
+            previous = controller_from_config(read_json_file(self.config_path))
+        except Exception:
+            previous = None
+        if previous and previous[0] == '127.0.0.1' and previous[1] not in reserved:
+            enable_clash_api(config_data, previous[1], previous[2])
+            return
+        port = reservation.hold_any()
+        while port in reserved:
+            port = reservation.hold_any()
+        enable_clash_api(config_data, port)
+
+    @staticmethod
+    def _wait_ports_free(ports, timeout):
+        """Poll until a stopped core's ports can be bound again, or the timeout passes"""
+        deadline = time.monotonic() + timeout
+        pending = set(ports)
+        while pending:
+            pending = {p for p in pending if not port_is_free(p)}
+            if not pending or time.monotonic() >= deadline:
+                break
+            time.sleep(0.05)
+        if pending:
+            print(f"Warning: ports still busy after {timeout}s: {sorted(pending)}")
+
+    def start(self, timer=None, reserved=None):
+        """Check and start the core plus its RR helpers; returns a JSON-ready result.
+
+        `reserved` ({port: owner}) holds ports owned by other instances.
+        """
+        span = PhaseTimer.span_of(timer)
+        pm = self.process_manager
+
+        with span('stop_helpers'):
+            self.rr.stop_all()
+            self.traffic.stop()
+
+        with span('kill_existing'):
+            pm.kill_existing_processes(timeout=PORT_RELEASE_TIMEOUT)
+            self._wait_ports_free(self.listen_ports, PORT_RELEASE_TIMEOUT)
+            self.listen_ports = set()
+        # Only the editor's own core falls back to the starter config; a profile
+        # instance without a saved config has nothing meaningful to run
+        if self.name == DEFAULT_INSTANCE:
+            ensure_config_exists(self.config_path)
+
+        if not os.path.exists(self.config_path):
+            print(f"!! Config missing: {self.config_path}")
+            return {"status": "error", "message": f"Config missing at {self.config_path}"}
+
+        print(f"Checking Binary at: {self.bin_path}")
+        if not os.path.exists(self.bin_path):
+            print(f"!! Binary missing")
+            return {"status": "error", "message": f"Binary missing at {self.bin_path}"}
+
+        # Settle every listener port before the (slow) check so conflicts fail fast
+        try:
+            with span('read_config'):
+                config = read_json_file(self.config_path)
+            with span('plan_ports'):
+                ports, reservation = self.rr.plan_ports(config, reserved=reserved)
+        except Exception as e:
+            return {"status": "error", "message": f"Port planning failed: {e}"}
+
+        try:
+            if ports["conflicts"]:
+                return {
+                    "status": "error",
+                    "message": "Port conflict: " + self.rr.format_conflicts(ports["conflicts"]),
+                    "ports": ports
+                }
+            controller, controller_changed = None, False
+            if self.clash_api:
+                controller = controller_from_config(config)
+                # Keep a previous controller port while it is still free, otherwise pick a new one
+                if controller is None or (
+                    controller[0] == '127.0.0.1'
+                    and (controller[1] in (reserved or {}) or not reservation.try_hold(controller[1]))
+                ):
+                    port = reservation.hold_any()
+                    while port in (reserved or {}):
+                        port = reservation.hold_any()
+                    secret = enable_clash_api(config, port, controller[2] if controller else None)
+                    controller, controller_changed = ('127.0.0.1', port, secret), True
+            if ports["remapped"]:
+                print(f"Reassigned round-robin ports: {ports['remapped']}")
+            if ports["remapped"] or controller_changed:
+                with span('write_config'):
+                    write_json_atomic(self.config_path, config)
+
+            with span('check'):
+                ok, detail = run_singbox_check(self.config_path, self.bin_path)
+            if not ok:
+                return {
+                    "status": "error",
+                    "message": "Config validation failed before start",
+                    "detail": detail
+                }
+        finally:
+            reservation.release()
+
+        rr_meta = load_rr_meta(self.config_path)
+        try:
+            with span('rr_start'):
+                self.rr.start_from_config(self.config_path, rr_meta)
+        except Exception as e:
+            return {
+                "status": "error",
+                "message": f"Round-robin helper start failed: {e}"
+            }
+
+        success, result = pm.start(timer=timer)
+        if not success:
+            self.rr.stop_all()
+            return {
+                "status": "error",
+                "message": result
+            }
+
+        print(">> Process running stable")
+        self.listen_ports = config_listen_ports(config)
+        if controller:
+            self.traffic.start(*controller, aliases=self._rr_aliases(rr_meta))
+        return {
+            "status": "success",
+            "pid": pm.process.pid,
+            "detail": result
+        }
+
+    def stop(self):
+        success, message = self.process_manager.stop()
+        if success:
+            self.stop_helpers()
+        return success, message
+
+    def stop_helpers(self):
+        self.rr.stop_all()
+        self.traffic.stop()
+
+    @staticmethod
+    def _rr_aliases(rr_meta):
+        """sys-rr-<id>-lb outbound tag -> the editor's round-robin node tag"""
+        return {
+            f"{RRProxyManager.RR_PREFIX}{gid}{RRProxyManager.RR_OUT_SUFFIX}": g["tag"]
+            for gid, g in rr_meta.items()
+            if isinstance(g, dict) and g.get("tag")
+        }
+
+
+class InstanceRegistry:
+    """The default editor instance plus one instance per started profile.
+
+    Profile instances live in config/instances/<profile>/ (config.json,
+    rr-meta.json, sing-box.log) and survive server restarts as stopped entries.
+    """
+
+    def __init__(self, base_dir, bin_path, default_config_path, clash_api=True, on_create=None):
+        self.instances_dir = os.path.join(base_dir, 'config', 'instances')
+        self.bin_path = bin_path
+        self.clash_api = clash_api
+        self.on_create = on_create
+        self._lock = threading.Lock()
+        # Serializes create() so two requests cannot set up the same profile at once
+        self._create_lock = threading.Lock()
+        self._instances = {}
+        self.default = self._add(
+            CoreInstance(DEFAULT_INSTANCE, default_config_path, bin_path, os.path.join(base_dir, 'sing-box.log'), clash_api)
+        )
+        if os.path.isdir(self.instances_dir):
+            for entry in sorted(os.listdir(self.instances_dir)):
+                if os.path.isfile(os.path.join(self.instances_dir, entry, 'config.json')):
+                    self._add(self._profile_instance(entry + '.json'))
+
+    def _add(self, instance):
+        with self._lock:
+            self._instances[instance.name] = instance
+        if self.on_create:
+            self.on_create(instance)
+        return instance
+
+    def _instance_dir(self, name):
+        return os.path.join(self.instances_dir, name[:-len('.json')])
+
+    def _profile_instance(self, name):
+        inst_dir = self._instance_dir(name)
+        return CoreInstance(
+            name, os.path.join(inst_dir, 'config.json'), self.bin_path, os.path.join(inst_dir, 'sing-box.log'), self.clash_api
+        )
+
+    def get(self, name):
+        with self._lock:
+            return self._instances.get(name)
+
+    def create(self, name, save):
+        """Set up an instance for profile `name` and register it once `save(instance)` succeeds.
+
+        `save` returns a JSON-ready result. On failure nothing is registered and a
+        directory created for the attempt is removed. Returns (instance or None, result).
+        """
+        with self._create_lock:
+            instance = self.get(name)
+            if instance is not None:
+                return instance, save(instance)
+            instance = self._profile_instance(name)
+            inst_dir = self._instance_dir(name)
+            fresh = not os.path.exists(inst_dir)
+            result = save(instance)
+            if result.get("status") != "success":
+                if fresh:
+                    shutil.rmtree(inst_dir, ignore_errors=True)
+                return None, result
+            return self._add(instance), result
+
+    def list(self):
+        with self._lock:
+            return list(self._instances.values())
+
+    def reserved_ports(self, exclude):
+        """{port: owner} for the listeners of every other running instance"""
+        reserved = {}
+        for instance in self.list():
+            if instance is exclude or not instance.is_running():
+                continue
+            for port in instance.listen_ports:
+                reserved[port] = f"instance {instance.name}"
+        return reserved
+
+    def remove(self, name):
+        """Forget a stopped profile instance and delete its directory"""
+        if name == DEFAULT_INSTANCE:
+            raise ValueError("The default instance cannot be removed")
+        with self._lock:
+            instance = self._instances.get(name)
+            if instance is None:
+                raise KeyError(name)
+            if instance.is_running():
+                raise RuntimeError(f"Instance {name} is running")
+            del self._instances[name]
+        shutil.rmtree(self._instance_dir(name), ignore_errors=True)
+
+    def stop_all(self):
+        for instance in self.list():
+            instance.stop()
@@ -1,30 +1,48 @@
 import http.server
 import json
 import os
+import queue
 import socketserver
-import sys
+import threading
 import time
 from urllib.parse import urlparse, parse_qs
 
 # Import modules
-from installer import install_sing_box_core
 from proxy_manager import RRProxyManager
-from config_handler import (
-    get_singbox_env,
-    run_singbox_check,
-    ensure_config_exists,
-    ensure_profiles_dir,
-    save_config,
-    normalize_profile_name
-)
-from process_manager import SingBoxProcessManager
+from config_handler import normalize_profile_name
+from instance_manager import DEFAULT_INSTANCE, InstanceRegistry
+from diagnostics import PhaseTimer, RequestProfiler
+from events import KEEPALIVE_SECONDS, EventBus, format_sse
+import metrics
+from node_prober import NodeProber
+from profile_store import ProfileLoadCache, open_profile_store
+from static_assets import StaticAssetCache
 
 # Configuration
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-PORT = 19999
+PORT = int(os.environ.get('SINGBOX_EDITOR_PORT', 19999))
 WEB_DIR = os.path.join(BASE_DIR, 'web')
+# Serve all page scripts as one concatenated bundle.js
+BUNDLE_JS = os.environ.get('SINGBOX_BUNDLE_JS', '0') == '1'
 CONFIG_PATH = os.path.join(BASE_DIR, 'config', 'config.json')
 PROFILES_DIR = os.path.join(BASE_DIR, 'config', 'profiles')
+PROFILES_DB_PATH = os.path.join(BASE_DIR, 'config', 'profiles.db')
+# 'sqlite' (indexed rows, default) or 'json' (one file per profile)
+PROFILE_STORE_BACKEND = os.environ.get('SINGBOX_PROFILE_STORE', 'sqlite')
+# JSON profile file format: 'pretty', 'compact' or 'gzip' (loads detect gzip automatically)
+PROFILE_FORMAT = os.environ.get('SINGBOX_PROFILE_FORMAT', 'pretty')
+# Enable sing-box's clash_api on a local port at start for live traffic stats
+CLASH_API_ENABLED = os.environ.get('SINGBOX_CLASH_API', '1') == '1'
+# Seconds between live traffic pushes to /api/events subscribers (only sent when changed)
+TRAFFIC_PUSH_INTERVAL = 2.0
+# Allow /api/debug/profile to capture cProfile/tracemalloc reports
+PROFILING_ENABLED = os.environ.get('SINGBOX_PROFILING', '0') == '1'
+# Round-robin helper admission control (0 = unlimited): concurrent connections
+# per group and across all groups, listen backlog, and whole-handshake timeout
+RR_MAX_CONNS_PER_GROUP = int(os.environ.get('SINGBOX_RR_MAX_CONNS_PER_GROUP', 256))
+RR_MAX_CONNS = int(os.environ.get('SINGBOX_RR_MAX_CONNS', 1024))
+RR_BACKLOG = int(os.environ.get('SINGBOX_RR_BACKLOG', 128))
+RR_HANDSHAKE_TIMEOUT = float(os.environ.get('SINGBOX_RR_HANDSHAKE_TIMEOUT', 10))
 
 # Determine Binary Name based on OS
 import platform
@@ -32,82 +50,420 @@ SYSTEM_OS = platform.system()
 BIN_NAME = "sing-box.exe" if SYSTEM_OS == "Windows" else "sing-box"
 BIN_PATH = os.path.join(BASE_DIR, 'bin', BIN_NAME)
 
-# Global Process Handler
-singbox_process = None
-process_manager = SingBoxProcessManager(BIN_PATH, CONFIG_PATH)
-rr_proxy_manager = RRProxyManager()
+RRProxyManager.configure_limits(RR_MAX_CONNS_PER_GROUP, RR_MAX_CONNS, RR_BACKLOG, RR_HANDSHAKE_TIMEOUT)
+
+# Global Handlers
+node_prober = NodeProber(BIN_PATH, os.path.join(BASE_DIR, 'temp'))
+profile_store = open_profile_store(PROFILES_DIR, PROFILES_DB_PATH, PROFILE_STORE_BACKEND, PROFILE_FORMAT)
+profile_cache = ProfileLoadCache(profile_store)
+static_assets = None  # built in run_server()
+event_bus = EventBus()
+# Handlers whose phase timings are logged and returned in a `timings` field
+TIMED_ROUTES = {
+    '/api/start', '/api/save_config', '/api/instances/start',
+    '/api/profiles/list', '/api/profiles/load', '/api/profiles/export', '/api/profiles/create',
+    '/api/profiles/save', '/api/profiles/patch', '/api/profiles/delete'
+}
+# Long-lived responses, kept out of request profiling and the latency histogram
+STREAMING_ROUTES = {'/api/events'}
+request_profiler = RequestProfiler(os.path.join(BASE_DIR, 'temp', 'profiles'))
+
+# Metrics
+CORE_UP = metrics.gauge(
+    "singbox_core_up", "Whether the sing-box core process is running", ("instance",),
+    fn=lambda: {(i.name,): 1 if i.is_running() else 0 for i in registry.list()}
+)
+
+
+def _core_uptimes():
+    uptimes = {}
+    for i in registry.list():
+        up = i.process_manager.uptime()
+        if up is not None:
+            uptimes[(i.name,)] = up
+    return uptimes
+
+
+CORE_UPTIME = metrics.gauge(
+    "singbox_core_uptime_seconds", "Seconds since the running core was started", ("instance",),
+    fn=_core_uptimes
+)
+CORE_STARTS = metrics.counter(
+    "singbox_core_starts_total", "Core start requests by outcome", ("instance", "result")
+)
+CORE_RESTARTS = metrics.counter(
+    "singbox_core_restarts_total", "Successful core starts after an earlier run", ("instance",)
+)
+CORE_START_DURATION = metrics.histogram(
+    "singbox_core_start_duration_seconds", "Time to handle a core start request (check included)",
+    ("instance", "result")
+)
+API_REQUESTS = metrics.counter("singbox_editor_http_requests_total", "HTTP requests served", ("method", "route", "code"))
+API_LATENCY = metrics.histogram(
+    "singbox_editor_http_request_duration_seconds", "HTTP request handling time", ("method", "route")
+)
+
+
+_last_rr_groups = {}
+
+
+def publish_rr_status(instance):
+    """Publish an instance's running RR groups if they changed since its last event"""
+    groups = instance.rr.status()
+    if groups != _last_rr_groups.get(instance.name):
+        _last_rr_groups[instance.name] = groups
+        event_bus.publish("rr", {"instance": instance.name, "groups": groups})
+
+
+def wire_instance(instance):
+    """Route an instance's process and RR callbacks to the event bus"""
+    def on_exit(pid, returncode, expected):
+        if not expected:
+            # The core crashed: its RR helpers and stats source are gone with it
+            instance.stop_helpers()
+            publish_rr_status(instance)
+        event_bus.publish("core", instance.state(
+            reason="stopped" if expected else "exited", exited_pid=pid, exit_code=returncode
+        ))
+
+    def on_log(line):
+        event_bus.publish("log", {"instance": instance.name, "line": line.rstrip("\n")})
+
+    def on_eject(group_id, backend_id):
+        event_bus.publish("rr_eject", {
+            "instance": instance.name, "group": group_id, "backend": backend_id,
+            "seconds": RRProxyManager.EJECT_SECONDS
+        })
+
+    instance.process_manager.on_exit = on_exit
+    instance.process_manager.on_log = on_log
+    instance.rr.on_eject = on_eject
+
 
+registry = InstanceRegistry(BASE_DIR, BIN_PATH, CONFIG_PATH, CLASH_API_ENABLED, on_create=wire_instance)
+
+install_job = None  # installer.InstallJob, created on the first install
+_install_lock = threading.Lock()
+
+
+def start_install(version=None):
+    """Install the core on a background thread; returns (started, job)"""
+    global install_job
+    with _install_lock:
+        if install_job is None:
+            # The installer (tarfile, zipfile, hashlib) is only imported when it is needed
+            from installer import InstallJob
+            install_job = InstallJob(BASE_DIR, on_change=lambda status: event_bus.publish("install", status))
+    return install_job.start(version), install_job
+
+
+def install_status():
+    status = install_job.status() if install_job else {"state": "idle"}
+    return {"installed": os.path.exists(BIN_PATH), **status}
+
+
+def push_traffic_loop():
+    """Push traffic stats to event subscribers whenever they change"""
+    last = {}
+    while True:
+        time.sleep(TRAFFIC_PUSH_INTERVAL)
+        if not event_bus.has_subscribers():
+            last = {}
+            continue
+        for instance in registry.list():
+            if not instance.is_running():
+                last.pop(instance.name, None)
+                continue
+            snap = instance.traffic.snapshot()
+            if not snap.get("available"):
+                continue
+            data = {"instance": instance.name, "total": snap["total"], "outbounds": snap["outbounds"]}
+            if data != last.get(instance.name):
+                event_bus.publish("traffic", data)
+                last[instance.name] = data
+
+
+class EditorHTTPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    # Allow address reuse to avoid "Address already in use" during restarts
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+class ProxyRequestHandler(http.server.BaseHTTPRequestHandler):
+    # Off for anything answered outside _timed, e.g. a malformed request line
+    report_timings = False
 
-class ProxyRequestHandler(http.server.SimpleHTTPRequestHandler):
     def do_GET(self):
-        if self.path == '/':
-            self.path = '/index.html'
-        elif self.path == '/api/profiles/list':
+        self._timed(self.route_get)
+
+    def do_HEAD(self):
+        self._timed(lambda: self.handle_static(head_only=True))
+
+    def do_POST(self):
+        self._timed(self.route_post)
+
+    def _timed(self, route):
+        self._status = None
+        # Set by route_get/route_post to the matched route, so metric labels stay bounded
+        self.route_name = None
+        self.timer = PhaseTimer()
+        start = time.perf_counter()
+        path = urlparse(self.path).path
+        self.report_timings = path in TIMED_ROUTES
+        try:
+            # Streams would hold the profiler for their whole lifetime
+            if path == '/api/debug/profile' or path in STREAMING_ROUTES:
+                route()
+            else:
+                with request_profiler.capture(f"{self.command} {path}"):
+                    route()
+        finally:
+            if self.report_timings:
+                print(f"[timing] {self.command} {path} {self.timer.summary()}")
+                self.report_timings = False
+            if self.route_name and self._status != 404:
+                label = self.route_name
+            elif path.startswith('/api/') or path == '/metrics':
+                label = 'unmatched'
+            else:
+                label = 'static'
+            if label not in STREAMING_ROUTES:
+                API_LATENCY.observe(time.perf_counter() - start, self.command, label)
+            API_REQUESTS.inc(self.command, label, str(self._status or 0))
+
+    def send_response(self, code, message=None):
+        self._status = code
+        super().send_response(code, message)
+
+    def end_headers(self):
+        # Timed routes report their phases on every response, errors included
+        if self.report_timings:
+            self.send_header('Server-Timing', self.timer.server_timing())
+        super().end_headers()
+
+    def route_get(self):
+        if self.path == '/api/profiles/list':
+            self.route_name = '/api/profiles/list'
             self.handle_list_profiles()
             return
         elif self.path.startswith('/api/profiles/load'):
+            self.route_name = '/api/profiles/load'
             self.handle_load_profile()
             return
+        elif self.path.startswith('/api/profiles/export'):
+            self.route_name = '/api/profiles/export'
+            self.handle_export_profile()
+            return
         elif self.path == '/api/core_logs':
+            self.route_name = '/api/core_logs'
             self.handle_core_logs()
             return
-        return super().do_GET()
+        elif self.path == '/api/traffic':
+            self.route_name = '/api/traffic'
+            self.handle_traffic()
+            return
+        elif self.path == '/api/install':
+            self.route_name = '/api/install'
+            self.send_json({"status": "success", **install_status()})
+            return
+        elif self.path == '/api/events':
+            self.route_name = '/api/events'
+            self.handle_events()
+            return
+        elif self.path == '/api/instances':
+            self.route_name = '/api/instances'
+            self.handle_list_instances()
+            return
+        elif self.path.startswith('/api/instances/logs'):
+            self.route_name = '/api/instances/logs'
+            self.handle_instance_logs()
+            return
+        elif self.path == '/metrics':
+            self.route_name = '/metrics'
+            self.handle_metrics()
+            return
+        elif self.path == '/api/debug/profile':
+            self.route_name = '/api/debug/profile'
+            self.handle_profile_status()
+            return
+        self.handle_static()
 
-    def do_POST(self):
+    def route_post(self):
         if self.path == '/api/start':
+            self.route_name = '/api/start'
             self.handle_start()
         elif self.path == '/api/stop':
+            self.route_name = '/api/stop'
             self.handle_stop()
         elif self.path == '/api/status':
+            self.route_name = '/api/status'
             self.handle_status()
         elif self.path == '/api/save_config':
+            self.route_name = '/api/save_config'
             self.handle_save_config()
+        elif self.path == '/api/install':
+            self.route_name = '/api/install'
+            self.handle_install()
+        elif self.path == '/api/instances/start':
+            self.route_name = '/api/instances/start'
+            self.handle_instance_start()
+        elif self.path == '/api/instances/stop':
+            self.route_name = '/api/instances/stop'
+            self.handle_instance_stop()
+        elif self.path == '/api/instances/status':
+            self.route_name = '/api/instances/status'
+            self.handle_instance_status()
+        elif self.path == '/api/instances/delete':
+            self.route_name = '/api/instances/delete'
+            self.handle_instance_delete()
         elif self.path == '/api/profiles/create':
+            self.route_name = '/api/profiles/create'
             self.handle_create_profile()
         elif self.path == '/api/profiles/save':
+            self.route_name = '/api/profiles/save'
             self.handle_save_profile()
+        elif self.path == '/api/profiles/patch':
+            self.route_name = '/api/profiles/patch'
+            self.handle_patch_profile()
         elif self.path == '/api/profiles/delete':
+            self.route_name = '/api/profiles/delete'
             self.handle_delete_profile()
+        elif self.path == '/api/probe/start':
+            self.route_name = '/api/probe/start'
+            self.handle_probe_start()
+        elif self.path == '/api/probe/results':
+            self.route_name = '/api/probe/results'
+            self.handle_probe_results()
+        elif self.path == '/api/debug/profile':
+            self.route_name = '/api/debug/profile'
+            self.handle_profile_arm()
         else:
             self.send_error(404, "API Not Found")
 
-    def send_json(self, data):
-        self.send_response(200)
+    def send_json(self, data, code=200):
+        self.response_data = data
+        # Instrumented handlers report their phase timings alongside the result
+        timed = self.report_timings and isinstance(data, dict)
+        if timed:
+            data = {**data, "timings": self.timer.as_dict()}
+        self.send_response(code)
         self.send_header('Content-type', 'application/json')
         self.end_headers()
         self.wfile.write(json.dumps(data).encode('utf-8'))
 
     def get_json_body(self):
         content_length = int(self.headers['Content-Length'])
-        return json.loads(self.rfile.read(content_length))
+        with self.timer.span('read_body'):
+            raw = self.rfile.read(content_length)
+        with self.timer.span('parse'):
+            return json.loads(raw)
+
+    # --- Static Assets ---
+
+    def handle_static(self, head_only=False):
+        asset = static_assets.lookup(self.path) if static_assets else None
+        if asset is None:
+            self.send_error(404, "File not found")
+            return
+        query = urlparse(self.path).query
+        cache_control = static_assets.cache_control(asset, query)
+        body, encoding = static_assets.pick_encoding(asset, self.headers.get('Accept-Encoding'))
+        # Each encoding is its own representation, so it gets its own strong ETag
+        etag = f'{asset.etag[:-1]}-{encoding}"' if encoding else asset.etag
+        if etag in self._if_none_match():
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Cache-Control', cache_control)
+            self.send_header('Vary', 'Accept-Encoding')
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-type', asset.content_type)
+        self.send_header('Content-Length', str(len(body)))
+        if encoding:
+            self.send_header('Content-Encoding', encoding)
+        self.send_header('Vary', 'Accept-Encoding')
+        self.send_header('ETag', etag)
+        self.send_header('Cache-Control', cache_control)
+        self.end_headers()
+        if not head_only:
+            self.wfile.write(body)
 
     # --- Profile Management ---
 
     def handle_list_profiles(self):
-        ensure_profiles_dir(PROFILES_DIR)
         try:
-            files = [f for f in os.listdir(PROFILES_DIR) if f.endswith('.json')]
-            self.send_json({"profiles": files})
+            with self.timer.span('store_list'):
+                items = profile_store.list()
+            self.send_json({
+                "profiles": [item["name"] for item in items],
+                "items": items,
+                "backend": profile_store.backend
+            })
         except Exception as e:
             self.send_json({"status": "error", "message": str(e)})
 
-    def handle_load_profile(self):
+    def _query_profile_name(self):
         query = parse_qs(urlparse(self.path).query)
         raw = query.get('name', [None])[0]
-        name = normalize_profile_name(raw)
+        return normalize_profile_name(raw)
+
+    def handle_load_profile(self):
+        name = self._query_profile_name()
         if not name:
             self.send_json({"status": "error", "message": "Invalid or missing profile name"})
             return
-        path = os.path.join(PROFILES_DIR, name)
-        if os.path.exists(path):
-            try:
-                with open(path, 'r') as f:
-                    data = json.load(f)
-                self.send_json({"status": "success", "data": data})
-            except Exception as e:
-                self.send_json({"status": "error", "message": str(e)})
-        else:
+        try:
+            with self.timer.span('cache_get'):
+                cached = profile_cache.get(name)
+        except Exception as e:
+            self.send_json({"status": "error", "message": str(e)})
+            return
+        if cached is None:
             self.send_json({"status": "error", "message": "Profile not found"})
+            return
+        etag, body = cached
+        if etag in self._if_none_match():
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Cache-Control', 'no-cache')
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', etag)
+        # Cacheable, but always revalidated so edits show up immediately
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _if_none_match(self):
+        raw = self.headers.get('If-None-Match') or ''
+        tags = [t.strip() for t in raw.split(',') if t.strip()]
+        # Weak comparison is fine for GET revalidation
+        return [t[2:] if t.startswith('W/') else t for t in tags]
+
+    def handle_export_profile(self):
+        name = self._query_profile_name()
+        if not name:
+            self.send_json({"status": "error", "message": "Invalid or missing profile name"})
+            return
+        try:
+            with self.timer.span('store_export'):
+                body = profile_store.export_json(name)
+        except Exception as e:
+            self.send_json({"status": "error", "message": str(e)})
+            return
+        if body is None:
+            self.send_json({"status": "error", "message": "Profile not found"})
+            return
+        self.send_response(200)
+        self.send_header('Content-type', 'application/json')
+        self.send_header('Content-Disposition', f'attachment; filename="{name}"')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
 
     def handle_create_profile(self):
         data = self.get_json_body()
@@ -116,31 +472,15 @@ class ProxyRequestHandler(http.server.SimpleHTTPRequestHandler):
         if not name:
             self.send_json({"status": "error", "message": "Invalid or missing profile name"})
             return
-        path = os.path.join(PROFILES_DIR, name)
-        default_state = {
-            "inbounds": [
-                {
-                    "tag": "mixed-10808",
-                    "type": "mixed",
-                    "port": 10808,
-                    "detours": [],
-                    "selectorDefault": None
-                }
-            ],
-            "nodeLibrary": [
-                { "id": "lib-direct", "tag": "direct", "type": "direct" }
-            ],
-            "layers": [
-                {
-                    "id": "layer-1",
-                    "title": "HOP 1",
-                    "nodes": []
-                }
-            ]
-        }
+        # Optional content makes this double as JSON import
+        content = data.get('content')
+        if content is not None and not isinstance(content, dict):
+            self.send_json({"status": "error", "message": "Invalid profile content"})
+            return
         try:
-            with open(path, 'w') as f:
-                json.dump(default_state, f, indent=2)
+            with self.timer.span('store_create'):
+                profile_store.create(name, content)
+            profile_cache.invalidate(name)
             self.send_json({"status": "success"})
         except Exception as e:
             self.send_json({"status": "error", "message": str(e)})
@@ -153,14 +493,31 @@ class ProxyRequestHandler(http.server.SimpleHTTPRequestHandler):
         if not name or not content:
             self.send_json({"status": "error", "message": "Missing name or content"})
             return
-        path = os.path.join(PROFILES_DIR, name)
         try:
-            with open(path, 'w') as f:
-                json.dump(content, f, indent=2)
+            with self.timer.span('store_save'):
+                profile_store.save(name, content)
+            profile_cache.invalidate(name)
             self.send_json({"status": "success"})
         except Exception as e:
              self.send_json({"status": "error", "message": str(e)})
 
+    def handle_patch_profile(self):
+        data = self.get_json_body()
+        name = normalize_profile_name(data.get('name'))
+        sections = data.get('sections')
+        if not name or not isinstance(sections, dict) or not sections:
+            self.send_json({"status": "error", "message": "Missing name or sections"})
+            return
+        try:
+            with self.timer.span('store_patch'):
+                profile_store.patch(name, sections)
+            profile_cache.invalidate(name)
+            self.send_json({"status": "success"})
+        except KeyError:
+            self.send_json({"status": "error", "message": "Profile not found"})
+        except Exception as e:
+            self.send_json({"status": "error", "message": str(e)})
+
     def handle_delete_profile(self):
         data = self.get_json_body()
         raw = data.get('name')
@@ -168,20 +525,48 @@ class ProxyRequestHandler(http.server.SimpleHTTPRequestHandler):
         if not name:
             self.send_json({"status": "error", "message": "Invalid or missing profile name"})
             return
-        path = os.path.join(PROFILES_DIR, name)
-        if os.path.exists(path):
-            try:
-                os.remove(path)
+        try:
+            with self.timer.span('store_delete'):
+                deleted = profile_store.delete(name)
+            profile_cache.invalidate(name)
+            if deleted:
                 self.send_json({"status": "success"})
-            except Exception as e:
-                self.send_json({"status": "error", "message": str(e)})
-        else:
-            self.send_json({"status": "error", "message": "File not found"})
+            else:
+                self.send_json({"status": "error", "message": "File not found"})
+        except Exception as e:
+            self.send_json({"status": "error", "message": str(e)})
+
+    # --- Node Probing ---
+
+    def handle_probe_start(self):
+        data = self.get_json_body()
+        nodes = data.get('nodes')
+        if not isinstance(nodes, list) or not nodes:
+            self.send_json({"status": "error", "message": "Missing nodes"})
+            return
+        ok, message = node_prober.start(nodes, target=data.get('target'))
+        self.send_json({"status": "success" if ok else "error", "message": message})
+
+    def handle_probe_results(self):
+        data = self.get_json_body()
+        nodes = data.get('nodes')
+        state = node_prober.results(
+            nodes if isinstance(nodes, list) else None,
+            target=data.get('target')
+        )
+        self.send_json({"status": "success", **state})
 
     # --- Core Logic ---
 
     def handle_core_logs(self):
-        log_path = os.path.join(os.path.dirname(__file__), 'sing-box.log')
+        self._send_logs(registry.default)
+
+    def _send_logs(self, instance):
+        pm = instance.process_manager
+        if pm.started_at is not None:
+            self.send_json({"logs": pm.recent_logs(50)})
+            return
+        log_path = pm.log_path
         if os.path.exists(log_path):
             try:
                 with open(log_path, 'r', encoding='utf-8', errors='replace') as f:
@@ -192,116 +577,276 @@ class ProxyRequestHandler(http.server.SimpleHTTPRequestHandler):
         else:
             self.send_json({"logs": ["Log file not found."]})
 
-    def handle_start(self):
-        global singbox_process
-        print(">> handle_start triggered")
-
-        rr_proxy_manager.stop_all()
-
-        process_manager.kill_existing_processes()
-        ensure_config_exists(CONFIG_PATH)
-
-        if not os.path.exists(CONFIG_PATH):
-            print(f"!! Config missing: {CONFIG_PATH}")
-            self.send_json({"status": "error", "message": f"Config missing at {CONFIG_PATH}"})
+    def handle_events(self):
+        """Server-sent events: core state, logs, RR status, save results and traffic"""
+        try:
+            last_id = int(self.headers.get('Last-Event-ID') or '')
+        except ValueError:
+            last_id = None
+        q = event_bus.subscribe(last_id)
+        self.close_connection = True
+        try:
+            self.send_response(200)
+            self.send_header('Content-type', 'text/event-stream')
+            self.send_header('Cache-Control', 'no-cache')
+            self.send_header('X-Accel-Buffering', 'no')
+            self.end_headers()
+            default = registry.default
+            hello = {
+                "core": default.state(),
+                "rr": {"instance": default.name, "groups": default.rr.status()},
+                "instances": [i.state() for i in registry.list()],
+                "install": install_status()
+            }
+            self.wfile.write(b"retry: 3000\n\n" + format_sse("hello", json.dumps(hello)))
+            while True:
+                if q.empty() and not event_bus.is_subscribed(q):
+                    break  # fell too far behind; the client reconnects with Last-Event-ID
+                try:
+                    event_id, event, payload = q.get(timeout=KEEPALIVE_SECONDS)
+                except queue.Empty:
+                    self.wfile.write(b": keepalive\n\n")
+                    continue
+                self.wfile.write(format_sse(event, payload, event_id))
+        except (BrokenPipeError, ConnectionResetError, ConnectionAbortedError):
+            pass
+        finally:
+            event_bus.unsubscribe(q)
+
+    def handle_traffic(self):
+        instance = registry.default
+        if not instance.is_running():
+            self.send_json({"status": "success", "running": False, "available": False, "outbounds": {}})
             return
+        self.send_json({"status": "success", "running": True, **instance.traffic.snapshot()})
 
-        print(f"Checking Binary at: {BIN_PATH}")
-        if not os.path.exists(BIN_PATH):
-             print(f"!! Binary missing")
-             self.send_json({"status": "error", "message": f"Binary missing at {BIN_PATH}"})
-             return
-
-        ok, detail = run_singbox_check(CONFIG_PATH, BIN_PATH)
-        if not ok:
-            self.send_json({
-                "status": "error",
-                "message": "Config validation failed before start",
-                "detail": detail
-            })
+    def handle_profile_status(self):
+        if not PROFILING_ENABLED:
+            self.send_json({"status": "error", "message": "Profiling is disabled (set SINGBOX_PROFILING=1)"})
             return
+        self.send_json({"status": "success", **request_profiler.status()})
 
+    def handle_profile_arm(self):
+        if not PROFILING_ENABLED:
+            self.send_json({"status": "error", "message": "Profiling is disabled (set SINGBOX_PROFILING=1)"})
+            return
+        data = self.get_json_body()
         try:
-            rr_proxy_manager.start_from_config(CONFIG_PATH)
-        except Exception as e:
-            self.send_json({
-                "status": "error",
-                "message": f"Round-robin helper start failed: {e}"
-            })
+            request_profiler.arm(data.get('requests', 10), data.get('mode', 'cprofile'))
+        except (ValueError, TypeError, RuntimeError) as e:
+            self.send_json({"status": "error", "message": str(e)})
             return
+        self.send_json({"status": "success", **request_profiler.status()})
 
-        success, result = process_manager.start()
-        if success:
-            singbox_process = process_manager.process
-            print(">> Process running stable")
-            self.send_json({
-                "status": "success",
-                "pid": process_manager.process.pid,
-                "detail": result
-            })
-        else:
-            rr_proxy_manager.stop_all()
-            self.send_json({
-                "status": "error",
-                "message": result
-            })
+    def handle_metrics(self):
+        body = metrics.REGISTRY.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-type', metrics.CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def handle_start(self):
+        print(">> handle_start triggered")
+        self.send_json(self._start_instance(registry.default))
+
+    def _start_instance(self, instance):
+        """Start one instance under its lock and publish the outcome; returns the result"""
+        if install_job and install_job.is_running():
+            return {"status": "error", "message": "The sing-box core is still being installed, try again when it finishes"}
+        with instance.lock:
+            started = time.perf_counter()
+            ran_before = instance.process_manager.started_at is not None
+            result = instance.start(timer=self.timer, reserved=registry.reserved_ports(exclude=instance))
+            running = instance.is_running()
+            event_bus.publish("core", instance.state(
+                reason="started" if running else "start_failed",
+                message=None if running else result.get("message"),
+                detail=result.get("detail")
+            ))
+            publish_rr_status(instance)
+        outcome = "success" if running else "failure"
+        CORE_STARTS.inc(instance.name, outcome)
+        CORE_START_DURATION.observe(time.perf_counter() - started, instance.name, outcome)
+        if outcome == "success" and ran_before:
+            CORE_RESTARTS.inc(instance.name)
+        return result
+
+    def _stop_instance(self, instance):
+        with instance.lock:
+            success, message = instance.stop()
+            if success:
+                publish_rr_status(instance)
+        return {"status": "success" if success else "warning", "message": message}
+
+    def _save_instance_config(self, instance, config_data):
+        with instance.lock:
+            return instance.save_config(
+                config_data, timer=self.timer, reserved=registry.reserved_ports(exclude=instance)
+            )
 
     def handle_stop(self):
-        global singbox_process
-        success, message = process_manager.stop()
-        if success:
-            singbox_process = None
-            rr_proxy_manager.stop_all()
-        self.send_json({"status": "success" if success else "warning", "message": message})
+        self.send_json(self._stop_instance(registry.default))
 
     def handle_status(self):
-        global singbox_process
-        is_running = process_manager.is_running()
+        is_running = registry.default.is_running()
         self.send_json({"running": is_running})
 
     def handle_save_config(self):
-        content_length = int(self.headers['Content-Length'])
-        post_data = self.rfile.read(content_length)
         try:
-            config_data = json.loads(post_data)
+            config_data = self.get_json_body()
         except Exception as e:
             self.send_json({"status": "error", "message": f"Invalid JSON: {str(e)}"})
             return
 
-        success, message, detail = save_config(config_data, CONFIG_PATH, BIN_PATH)
+        result = self._save_instance_config(registry.default, config_data)
+        # Other open tabs learn about the save (or the validation failure) from the event
+        event_bus.publish("config", {**result, "origin": self.headers.get('X-Client-Id')})
+        self.send_json(result)
+
+    def handle_install(self):
+        try:
+            data = self.get_json_body()
+        except Exception as e:
+            self.send_json({"status": "error", "message": f"Invalid JSON: {str(e)}"})
+            return
+        version = data.get('version')
+        # Used in the download URL, so only release-style versions (e.g. 1.12.0-beta.1) pass
+        if version is not None and not (
+            isinstance(version, str) and version and all(c.isalnum() or c in '.-' for c in version)
+        ):
+            self.send_json({"status": "error", "message": "Invalid version"})
+            return
+        started, _ = start_install(version)
+        if not started:
+            self.send_json({"status": "error", "message": "An install is already running", **install_status()})
+            return
+        self.send_json({"status": "success", **install_status()})
+
+    # --- Instances ---
+
+    def _instance_request(self):
+        """(name, data) for the instance named in the JSON body; sends an error and returns None on failure"""
+        try:
+            data = self.get_json_body()
+        except Exception as e:
+            self.send_json({"status": "error", "message": f"Invalid JSON: {str(e)}"})
+            return None, None
+        raw = data.get('name')
+        name = DEFAULT_INSTANCE if raw == DEFAULT_INSTANCE else normalize_profile_name(raw)
+        if not name:
+            self.send_json({"status": "error", "message": "Invalid or missing instance name"})
+            return None, None
+        return name, data
+
+    def _instance_from_body(self):
+        """(instance, data) for an existing instance named in the JSON body; sends an error and returns None on failure"""
+        name, data = self._instance_request()
+        if name is None:
+            return None, None
+        instance = registry.get(name)
+        if instance is None:
+            self.send_json({"status": "error", "message": f"Instance not found: {name}"})
+            return None, None
+        return instance, data
+
+    def handle_list_instances(self):
         self.send_json({
-            "status": "success" if success else "error",
-            "message": message,
-            "detail": detail
+            "status": "success",
+            "instances": [i.status() for i in registry.list()],
+            "rr_limits": RRProxyManager.limits()
         })
 
+    def handle_instance_start(self):
+        name, data = self._instance_request()
+        if name is None:
+            return
+        print(f">> Starting instance {name}")
+        config_data = data.get('config')
+        if config_data is not None and not isinstance(config_data, dict):
+            self.send_json({"status": "error", "message": "config must be an object"})
+            return
+        instance = registry.get(name)
+        if instance is None:
+            # A new instance needs a real profile and a config; it is only kept once that config is saved
+            if config_data is None:
+                self.send_json({
+                    "status": "error",
+                    "message": f"Instance {name} has no saved config; send its config to start it"
+                }, code=400)
+                return
+            if not profile_store.exists(name):
+                self.send_json({"status": "error", "message": f"Profile not found: {name}"}, code=400)
+                return
+            instance, saved = registry.create(name, lambda inst: self._save_instance_config(inst, config_data))
+            if instance is None:
+                self.send_json({"instance": name, **saved})
+                return
+        elif config_data is not None:
+            saved = self._save_instance_config(instance, config_data)
+            if saved["status"] != "success":
+                self.send_json({"instance": name, **saved})
+                return
+        self.send_json({"instance": name, **self._start_instance(instance)})
+
+    def handle_instance_stop(self):
+        instance, _ = self._instance_from_body()
+        if instance is None:
+            return
+        self.send_json({"instance": instance.name, **self._stop_instance(instance)})
+
+    def handle_instance_status(self):
+        instance, _ = self._instance_from_body()
+        if instance is None:
+            return
+        self.send_json({"status": "success", **instance.status()})
+
+    def handle_instance_logs(self):
+        query = parse_qs(urlparse(self.path).query)
+        raw = query.get('name', [None])[0]
+        name = DEFAULT_INSTANCE if raw == DEFAULT_INSTANCE else normalize_profile_name(raw)
+        instance = registry.get(name) if name else None
+        if instance is None:
+            self.send_json({"status": "error", "message": "Invalid or unknown instance name"})
+            return
+        self._send_logs(instance)
+
+    def handle_instance_delete(self):
+        instance, _ = self._instance_from_body()
+        if instance is None:
+            return
+        try:
+            registry.remove(instance.name)
+        except (ValueError, RuntimeError) as e:
+            self.send_json({"status": "error", "message": str(e)})
+            return
+        except KeyError:
+            self.send_json({"status": "error", "message": f"Instance not found: {instance.name}"})
+            return
+        _last_rr_groups.pop(instance.name, None)
+        self.send_json({"status": "success", "message": f"Instance {instance.name} removed"})
 
 def run_server():
-    os.chdir(WEB_DIR) # Serve static files from web directory
-    # Allow address reuse to avoid "Address already in use" during restarts
-    socketserver.TCPServer.allow_reuse_address = True
-    with socketserver.TCPServer(('', PORT), ProxyRequestHandler) as httpd:
+    global static_assets
+    static_assets = StaticAssetCache(WEB_DIR, bundle_js=BUNDLE_JS)
+    print(f"Loaded {len(static_assets.assets)} static assets from {WEB_DIR}")
+    threading.Thread(target=push_traffic_loop, daemon=True).start()
+    with EditorHTTPServer(('', PORT), ProxyRequestHandler) as httpd:
         print(f"Serving at http://localhost:{PORT}")
         print(f"Core binary expected at: {BIN_PATH}")
         try:
             httpd.serve_forever()
         except KeyboardInterrupt:
             print("\nServer stopped.")
-            if singbox_process:
-                singbox_process.terminate()
+            registry.stop_all()
 
 
 if __name__ == "__main__":
     print("Initializing Sing-Box Wrapper...")
 
-    # Auto-install core if missing
+    # Install a missing core in the background so the UI is served right away
     if not os.path.exists(BIN_PATH):
-        print("Core binary not found, installing automatically...")
-        try:
-            install_sing_box_core(BASE_DIR)
-        except Exception as e:
-            print(f"ERROR: Failed to install sing-box core: {e}")
-            print("Please check your internet connection and try again.")
-            sys.exit(1)
+        print("Core binary not found, installing in the background...")
+        start_install()
 
-    run_server()
\ No newline at end of file
+    run_server()
@@ -0,0 +1,191 @@
+import bisect
+import threading
+from collections import deque
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Hot-path events queue up lock-free and are folded in at scrape time, or
+# earlier (without ever waiting on the lock) once this many are pending
+DRAIN_THRESHOLD = 4096
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and not value.is_integer():
+        return repr(value)
+    return str(int(value))
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._pending = deque()  # append/popleft are atomic: no lock for writers
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _record(self, event):
+        self._pending.append(event)
+        if len(self._pending) > DRAIN_THRESHOLD and self._lock.acquire(blocking=False):
+            try:
+                self._drain()
+            finally:
+                self._lock.release()
+
+    def _drain(self):
+        pending = self._pending
+        while True:
+            try:
+                event = pending.popleft()
+            except IndexError:
+                return
+            self._apply(*event)
+
+    def _apply(self, labels, value):
+        raise NotImplementedError
+
+    def _samples(self):
+        """Yield (suffix, label values, extra label pairs, value)"""
+        for labels, value in sorted(self._values.items()):
+            yield "", labels, (), value
+
+    def render(self):
+        with self._lock:
+            self._drain()
+            samples = list(self._samples())
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, labels, extra, value in samples:
+            lines.append(f"{self.name}{suffix}{_format_labels(self.labelnames, labels, extra)} {_format_value(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, *labels, amount=1):
+        self._record((labels, amount))
+
+    def _apply(self, labels, value):
+        self._values[labels] = self._values.get(labels, 0) + value
+
+
+class Gauge(_Metric):
+    """Settable gauge; with `fn` it is read at scrape time instead.
+
+    `fn` returns a number, or a dict of label tuple -> number.
+    """
+    kind = "gauge"
+
+    def __init__(self, name, help_text, labelnames=(), fn=None):
+        super().__init__(name, help_text, labelnames)
+        self.fn = fn
+
+    def set(self, value, *labels):
+        self._record((labels, ("set", value)))
+
+    def inc(self, *labels, amount=1):
+        self._record((labels, ("add", amount)))
+
+    def dec(self, *labels, amount=1):
+        self._record((labels, ("add", -amount)))
+
+    def _apply(self, labels, value):
+        op, amount = value
+        if op == "set":
+            self._values[labels] = amount
+        else:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def _samples(self):
+        if self.fn is None:
+            yield from super()._samples()
+            return
+        try:
+            value = self.fn()
+        except Exception:
+            return
+        if isinstance(value, dict):
+            for labels, v in sorted(value.items()):
+                yield "", tuple(labels), (), v
+        elif value is not None:
+            yield "", (), (), value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, *labels):
+        self._record((labels, value))
+
+    def _apply(self, labels, value):
+        state = self._values.get(labels)
+        if state is None:
+            state = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        state[0][bisect.bisect_left(self.buckets, value)] += 1
+        state[1] += value
+        state[2] += 1
+
+    def _samples(self):
+        for labels, (counts, total, count) in sorted(self._values.items()):
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                cumulative += n
+                yield "_bucket", labels, (("le", _format_value(float(bound))),), cumulative
+            yield "_sum", labels, (), total
+            yield "_count", labels, (), count
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, cls, name, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+            return metric
+
+    def counter(self, name, help_text, labelnames=()):
+        return self._register(Counter, name, help_text, labelnames)
+
+    def gauge(self, name, help_text, labelnames=(), fn=None):
+        return self._register(Gauge, name, help_text, labelnames, fn=fn)
+
+    def histogram(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram, name, help_text, labelnames, buckets=buckets)
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+counter = REGISTRY.counter
+gauge = REGISTRY.gauge
+histogram = REGISTRY.histogram
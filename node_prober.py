@@ -0,0 +1,348 @@
+import hashlib
+import json
+import os
+import socket
+import subprocess
+import threading
+import time
+from urllib.parse import urlparse
+
+from config_handler import get_singbox_env
+from proxy_manager import RRProxyManager
+
+
+DEFAULT_TARGET = "https://speed.cloudflare.com/__down?bytes=1048576"
+DEFAULT_TTL = 300
+DEFAULT_WORKERS = 8
+DEFAULT_TIMEOUT = 10
+DEFAULT_MAX_BYTES = 4 * 1024 * 1024
+MAX_HEADER_BYTES = 64 * 1024
+
+# Group-like types have no server of their own, so there is nothing to measure
+UNPROBEABLE_TYPES = ("selector", "urltest", "roundrobin", "block")
+
+
+def node_to_outbound(node, tag):
+    """Build a sing-box outbound from a nodeLibrary entry (mirrors chain-core.js)"""
+    o = {"type": node.get("type"), "tag": tag}
+    if node.get("server"):
+        o["server"] = node["server"]
+    if node.get("port"):
+        o["server_port"] = node["port"]
+    if node.get("password"):
+        o["password"] = node["password"]
+    if node.get("uuid"):
+        o["uuid"] = node["uuid"]
+    if node.get("method"):
+        o["method"] = node["method"]
+    if node.get("tls"):
+        o["tls"] = node["tls"]
+    return o
+
+
+def _free_ports(count):
+    """Reserve `count` distinct free loopback ports"""
+    socks = []
+    try:
+        for _ in range(count):
+            s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            s.bind(("127.0.0.1", 0))
+            socks.append(s)
+        return [s.getsockname()[1] for s in socks]
+    finally:
+        for s in socks:
+            s.close()
+
+
+def _socks5_connect(sock_obj, host, port):
+    """Issue a no-auth SOCKS5 CONNECT on an already connected socket"""
+    sock_obj.sendall(b"\x05\x01\x00")
+    resp = RRProxyManager._recv_exact(sock_obj, 2)
+    if resp[0] != 5 or resp[1] != 0:
+        raise ConnectionError("SOCKS method negotiation failed")
+    host_raw = host.encode("idna")
+    sock_obj.sendall(b"\x05\x01\x00\x03" + bytes([len(host_raw)]) + host_raw + port.to_bytes(2, "big"))
+    rep = RRProxyManager._recv_exact(sock_obj, 4)
+    if rep[0] != 5 or rep[1] != 0:
+        raise ConnectionError(f"SOCKS connect failed (rep={rep[1]})")
+    RRProxyManager._consume_socks_addr(sock_obj, rep[3])
+    RRProxyManager._recv_exact(sock_obj, 2)
+
+
+def _wait_for_ports(ports, deadline):
+    pending = set(ports)
+    while pending and time.monotonic() < deadline:
+        for port in list(pending):
+            try:
+                with socket.create_connection(("127.0.0.1", port), timeout=0.2):
+                    pending.discard(port)
+            except OSError:
+                pass
+        if pending:
+            time.sleep(0.1)
+    return not pending
+
+
+class NodeProber:
+    """Measures library nodes through a temporary sing-box instance"""
+
+    PROBE_PREFIX = 'sys-probe-'
+
+    def __init__(self, bin_path, work_dir, ttl=DEFAULT_TTL, max_workers=DEFAULT_WORKERS):
+        self.bin_path = bin_path
+        self.work_dir = work_dir
+        self.ttl = ttl
+        self.max_workers = max_workers
+        self._lock = threading.Lock()
+        self._cache = {}  # (tag, fingerprint, target) -> (expires_at, result)
+        self._job = None  # {"thread", "target", "tags", "started", "error"}
+
+    @staticmethod
+    def _fingerprint(node):
+        raw = json.dumps(node, sort_keys=True, separators=(",", ":"))
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    def is_running(self):
+        with self._lock:
+            return bool(self._job and self._job["thread"].is_alive())
+
+    def start(self, nodes, target=None, timeout=DEFAULT_TIMEOUT, max_bytes=DEFAULT_MAX_BYTES):
+        """Start a background probe job; returns (ok, message)"""
+        target = target or DEFAULT_TARGET
+        parsed = urlparse(target)
+        if parsed.scheme not in ("http", "https") or not parsed.hostname:
+            return False, f"Unsupported probe target: {target}"
+
+        probeable = []
+        seen = set()
+        for n in nodes or []:
+            if not isinstance(n, dict) or not isinstance(n.get("tag"), str):
+                continue
+            if n.get("type") in UNPROBEABLE_TYPES or n["tag"] in seen:
+                continue
+            seen.add(n["tag"])
+            probeable.append(n)
+        if not probeable:
+            return False, "No probeable nodes selected"
+
+        with self._lock:
+            if self._job and self._job["thread"].is_alive():
+                return False, "A probe is already running"
+            t = threading.Thread(
+                target=self._run_job,
+                args=(probeable, target, timeout, max_bytes),
+                daemon=True
+            )
+            self._job = {
+                "thread": t,
+                "target": target,
+                "tags": [n["tag"] for n in probeable],
+                "started": time.time(),
+                "error": None
+            }
+        t.start()
+        return True, f"Probing {len(probeable)} node(s)"
+
+    def results(self, nodes=None, target=None):
+        """Return fresh cached results keyed by tag, plus job state"""
+        target = target or DEFAULT_TARGET
+        now = time.monotonic()
+        fingerprints = None
+        if nodes is not None:
+            fingerprints = {n.get("tag"): self._fingerprint(n) for n in nodes if isinstance(n, dict)}
+
+        out = {}
+        with self._lock:
+            for key, (expires, result) in list(self._cache.items()):
+                if expires <= now:
+                    del self._cache[key]
+                    continue
+                tag, fp, tgt = key
+                if tgt != target:
+                    continue
+                if fingerprints is not None and fingerprints.get(tag) != fp:
+                    continue
+                prev = out.get(tag)
+                if not prev or prev["measured_at"] < result["measured_at"]:
+                    out[tag] = result
+            job = self._job
+            state = {
+                "running": bool(job and job["thread"].is_alive()),
+                "target": job["target"] if job else target,
+                "pending": list(job["tags"]) if job and job["thread"].is_alive() else [],
+                "error": job["error"] if job else None
+            }
+        state["results"] = out
+        return state
+
+    def _store(self, node, target, result):
+        key = (node["tag"], self._fingerprint(node), target)
+        with self._lock:
+            self._cache[key] = (time.monotonic() + self.ttl, result)
+
+    def _build_config(self, nodes, ports):
+        inbounds = []
+        outbounds = []
+        rules = []
+        for i, (node, port) in enumerate(zip(nodes, ports)):
+            in_tag = f"{self.PROBE_PREFIX}in-{i}"
+            out_tag = f"{self.PROBE_PREFIX}out-{i}"
+            inbounds.append({
+                "type": "socks",
+                "tag": in_tag,
+                "listen": "127.0.0.1",
+                "listen_port": port
+            })
+            outbounds.append(node_to_outbound(node, out_tag))
+            rules.append({"inbound": [in_tag], "outbound": out_tag})
+        outbounds.append({"type": "direct", "tag": "direct"})
+        return {
+            "log": {"level": "warn", "timestamp": True},
+            "inbounds": inbounds,
+            "outbounds": outbounds,
+            "route": {"rules": rules}
+        }
+
+    def _run_job(self, nodes, target, timeout, max_bytes):
+        process = None
+        config_path = os.path.join(self.work_dir, "probe.json")
+        try:
+            if not os.path.exists(self.bin_path):
+                raise RuntimeError(f"Binary missing at {self.bin_path}")
+            os.makedirs(self.work_dir, exist_ok=True)
+
+            ports = _free_ports(len(nodes))
+            with open(config_path, "w", encoding="utf-8") as f:
+                json.dump(self._build_config(nodes, ports), f)
+
+            process = subprocess.Popen(
+                [self.bin_path, "run", "-c", config_path],
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+                env=get_singbox_env()
+            )
+            if not _wait_for_ports(ports, time.monotonic() + 5):
+                if process.poll() is not None:
+                    raise RuntimeError("Probe core exited immediately")
+                raise RuntimeError("Probe core did not open its inbounds in time")
+
+            def run_one(pair):
+                node, port = pair
+                result = self.measure(port, target, timeout, max_bytes)
+                self._store(node, target, result)
+
+            from concurrent.futures import ThreadPoolExecutor  # only needed once a probe runs
+
+            with ThreadPoolExecutor(max_workers=max(1, self.max_workers)) as pool:
+                list(pool.map(run_one, zip(nodes, ports)))
+        except Exception as e:
+            with self._lock:
+                if self._job:
+                    self._job["error"] = str(e)
+        finally:
+            if process and process.poll() is None:
+                process.terminate()
+                try:
+                    process.wait(timeout=3)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+            try:
+                os.unlink(config_path)
+            except OSError:
+                pass
+
+    @staticmethod
+    def measure(socks_port, target, timeout=DEFAULT_TIMEOUT, max_bytes=DEFAULT_MAX_BYTES):
+        """Fetch `target` through a local SOCKS5 port and time each phase"""
+        parsed = urlparse(target)
+        https = parsed.scheme == "https"
+        host = parsed.hostname
+        port = parsed.port or (443 if https else 80)
+        path = parsed.path or "/"
+        if parsed.query:
+            path += "?" + parsed.query
+
+        result = {
+            "ok": False,
+            "connect_ms": None,
+            "ttfb_ms": None,
+            "http_status": None,
+            "bytes": 0,
+            "throughput_kbps": None,
+            "error": None,
+            "measured_at": time.time()
+        }
+        sock_obj = None
+        try:
+            t0 = time.monotonic()
+            deadline = t0 + timeout
+            sock_obj = socket.create_connection(("127.0.0.1", socks_port), timeout=timeout)
+            _socks5_connect(sock_obj, host, port)
+            if https:
+                import ssl  # only needed for https targets
+                ctx = ssl.create_default_context()
+                sock_obj = ctx.wrap_socket(sock_obj, server_hostname=host)
+            result["connect_ms"] = round((time.monotonic() - t0) * 1000, 1)
+
+            request = (
+                f"GET {path} HTTP/1.1\r\n"
+                f"Host: {host}\r\n"
+                "User-Agent: singbox-topology-editor-probe\r\n"
+                "Accept: */*\r\n"
+                "Connection: close\r\n\r\n"
+            )
+            t_req = time.monotonic()
+            sock_obj.sendall(request.encode("ascii"))
+            first = sock_obj.recv(65536)
+            if not first:
+                raise ConnectionError("Empty response")
+            t_first = time.monotonic()
+            result["ttfb_ms"] = round((t_first - t_req) * 1000, 1)
+
+            buf = first
+            while b"\r\n\r\n" not in buf:
+                if len(buf) > MAX_HEADER_BYTES:
+                    raise ConnectionError("Response headers too large")
+                if time.monotonic() >= deadline:
+                    raise socket.timeout("Timed out reading response headers")
+                sock_obj.settimeout(max(0.1, deadline - time.monotonic()))
+                chunk = sock_obj.recv(65536)
+                if not chunk:
+                    raise ConnectionError("Connection closed before the response headers ended")
+                buf += chunk
+            head, _, body = buf.partition(b"\r\n\r\n")
+            status_line = head.split(b"\r\n", 1)[0].decode("latin-1")
+            parts = status_line.split(None, 2)
+            if len(parts) < 2 or not parts[0].startswith("HTTP/") or not parts[1].isdigit():
+                raise ConnectionError(f"Malformed status line: {status_line[:80]!r}")
+            result["http_status"] = int(parts[1])
+            # Error and captive-portal pages say nothing about the node's throughput
+            if not 200 <= result["http_status"] < 300:
+                result["error"] = f"HTTP {result['http_status']}"
+                return result
+
+            # Only the body counts toward size and throughput
+            total = len(body)
+            while total < max_bytes and time.monotonic() < deadline:
+                sock_obj.settimeout(max(0.1, deadline - time.monotonic()))
+                try:
+                    chunk = sock_obj.recv(65536)
+                except socket.timeout:
+                    break
+                if not chunk:
+                    break
+                total += len(chunk)
+            elapsed = time.monotonic() - t_first
+            result["bytes"] = total
+            if elapsed > 0:
+                result["throughput_kbps"] = round(total * 8 / 1000 / elapsed, 1)
+            result["ok"] = True
+        except Exception as e:
+            result["error"] = str(e) or e.__class__.__name__
+        finally:
+            if sock_obj:
+                try:
+                    sock_obj.close()
+                except Exception:
+                    pass
+        return result
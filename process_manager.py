@@ -1,35 +1,74 @@
 import os
 import platform
+import re
 import subprocess
 import sys
+import threading
 import time
+from collections import deque
+
+from diagnostics import PhaseTimer
+
+
+LOG_BUFFER_LINES = 200
+
+
+def _ere_escape(text):
+    """Escape `text` for the POSIX extended regex pkill -f expects"""
+    return re.sub(r'([.^$*+?()\[\]{}|\\])', r'\\\1', text)
 
 
 class SingBoxProcessManager:
     """Manages sing-box process lifecycle"""
 
-    def __init__(self, bin_path, config_path):
+    def __init__(self, bin_path, config_path, log_path=None):
         self.bin_path = bin_path
         self.config_path = config_path
+        self.log_path = log_path or os.path.join(os.path.dirname(config_path), '..', 'sing-box.log')
         self.process = None
+        self.started_at = None  # monotonic time of the last successful start
+        self.log_lines = deque(maxlen=LOG_BUFFER_LINES)
+        # Optional callbacks, run on the watcher thread:
+        #   on_log(line) for each output line, on_exit(pid, returncode, expected)
+        self.on_log = None
+        self.on_exit = None
+        self._stopping = None
         self.system_os = platform.system()
         self.bin_name = "sing-box.exe" if self.system_os == "Windows" else "sing-box"
 
-    def kill_existing_processes(self):
-        """Clean up existing sing-box processes"""
-        print("Cleaning up existing sing-box processes...")
+    def kill_existing_processes(self, timeout=5):
+        """Clean up sing-box processes left running with this config (other instances are kept)"""
+        print(f"Cleaning up existing sing-box processes for {self.config_path}...")
+        own = self.process
+        if own:
+            # Our own child dies here too; its exit is expected
+            self._stopping = self.process
+            self.process = None
         try:
             if self.system_os == "Windows":
-                subprocess.run(["taskkill", "/F", "/IM", self.bin_name, "/T"],
+                config = self.config_path.replace("'", "''")
+                script = (
+                    f"Get-CimInstance Win32_Process -Filter \"Name='{self.bin_name}'\" | "
+                    f"Where-Object {{ $_.CommandLine -like '*run -c {config}*' }} | "
+                    "ForEach-Object { Stop-Process -Id $_.ProcessId -Force }"
+                )
+                subprocess.run(["powershell", "-NoProfile", "-Command", script],
                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
             else:
-                subprocess.run(["pkill", "-9", "-f", self.bin_name],
+                pattern = _ere_escape(f"{self.bin_name} run -c {self.config_path}") + "$"
+                subprocess.run(["pkill", "-9", "-f", pattern],
                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            # The kill is asynchronous; reap our child so its ports are released before we go on
+            if own:
+                own.wait(timeout)
+        except subprocess.TimeoutExpired:
+            print(f"Warning: core process {own.pid} still running after {timeout}s")
         except Exception as e:
             print(f"Warning during cleanup: {e}")
 
-    def start(self):
-        """Start sing-box process"""
+    def start(self, timer=None):
+        """Start sing-box process; spawn/settle phases are recorded on `timer` if given"""
+        span = PhaseTimer.span_of(timer)
         if not os.path.exists(self.bin_path):
             return False, f"Binary missing at {self.bin_path}"
 
@@ -53,29 +92,44 @@ class SingBoxProcessManager:
             cmd = [self.bin_path, "run", "-c", self.config_path]
             print(f"Executing: {' '.join(cmd)}")
 
-            log_file_path = os.path.join(os.path.dirname(self.config_path), '..', 'sing-box.log')
+            log_file_path = self.log_path
+            os.makedirs(os.path.dirname(log_file_path), exist_ok=True)
             print(f"Logging to: {log_file_path}")
             # Truncate log on each start to avoid stale errors polluting UI
             log_file = open(log_file_path, 'w', encoding='utf-8')
+            self.log_lines.clear()
 
             env = self._get_env()
 
-            self.process = subprocess.Popen(
-                cmd,
-                stdout=log_file,
-                stderr=subprocess.STDOUT,
-                text=True,
-                startupinfo=startupinfo,
-                env=env
-            )
+            with span('core_spawn'):
+                try:
+                    self.process = subprocess.Popen(
+                        cmd,
+                        stdout=subprocess.PIPE,
+                        stderr=subprocess.STDOUT,
+                        text=True,
+                        encoding='utf-8',
+                        errors='replace',
+                        startupinfo=startupinfo,
+                        env=env
+                    )
+                except Exception:
+                    log_file.close()
+                    raise
             print(f"Process started with PID: {self.process.pid}")
-
-            # Check if process is still alive after a short delay
-            time.sleep(0.5)
-            if self.process.poll() is not None:
+            exited = threading.Event()
+            threading.Thread(
+                target=self._watch, args=(self.process, log_file, exited), daemon=True
+            ).start()
+
+            # Check if process is still alive after a short delay (returns early if it dies)
+            with span('core_settle'):
+                died = exited.wait(0.5)
+            if died:
                 self.process = None
                 return False, "Core exited immediately. Check logs."
 
+            self.started_at = time.monotonic()
             return True, f"Process started with PID {self.process.pid}"
 
         except Exception as e:
@@ -85,6 +139,7 @@ class SingBoxProcessManager:
     def stop(self):
         """Stop sing-box process"""
         if self.process:
+            self._stopping = self.process
             self.process.terminate()
             self.process = None
             return True, "Stopped"
@@ -94,6 +149,42 @@ class SingBoxProcessManager:
         """Check if process is running"""
         return self.process is not None and self.process.poll() is None
 
+    def recent_logs(self, n=50):
+        return list(self.log_lines)[-n:]
+
+    def _watch(self, proc, log_file, exited):
+        """Pump the core's output into the log file/buffer, then report its exit"""
+        try:
+            for line in proc.stdout:
+                log_file.write(line)
+                log_file.flush()
+                self.log_lines.append(line)
+                if self.on_log:
+                    try:
+                        self.on_log(line)
+                    except Exception:
+                        pass
+        except (OSError, ValueError):
+            pass
+        finally:
+            log_file.close()
+        returncode = proc.wait()
+        # A process that was stopped or already replaced is not a crash
+        expected = proc is self._stopping or proc is not self.process
+        exited.set()
+        print(f"Core process {proc.pid} exited with code {returncode}" + ("" if expected else " (unexpected)"))
+        if self.on_exit:
+            try:
+                self.on_exit(proc.pid, returncode, expected)
+            except Exception as e:
+                print(f"Warning: core exit handler failed: {e}")
+
+    def uptime(self):
+        """Seconds since the running process started, or None"""
+        if not self.is_running() or self.started_at is None:
+            return None
+        return time.monotonic() - self.started_at
+
     def _get_env(self):
         """Get environment variables for sing-box"""
         env = os.environ.copy()
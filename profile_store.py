@@ -0,0 +1,492 @@
+import copy
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+try:
+    import sqlite3
+except ImportError:  # minimal Python builds may ship without _sqlite3
+    sqlite3 = None
+
+import metrics
+from config_handler import (
+    DEFAULT_PROFILE,
+    PROFILE_FORMATS,
+    encode_json,
+    ensure_profiles_dir,
+    read_json_file,
+    write_json_atomic
+)
+
+
+PROFILE_CACHE_LOOKUPS = metrics.counter(
+    "singbox_profile_cache_lookups_total", "Profile load cache lookups", ("result",)
+)
+
+# Profile sections stored as one row per item, with the field used as row key
+SECTIONS = {
+    "nodeLibrary": "tag",
+    "layers": "id",
+    "inbounds": "tag",
+}
+
+
+def _dumps(data):
+    return json.dumps(data, separators=(",", ":"), ensure_ascii=False)
+
+
+def _row_keys(items, key_field):
+    """Row key per item: its tag/id, or its position when missing or already taken"""
+    keys, seen = [], set()
+    for pos, item in enumerate(items):
+        key = item.get(key_field) if isinstance(item, dict) else None
+        # '#' is reserved for positional keys so the two can never collide
+        if not isinstance(key, str) or key in seen or key.startswith("#"):
+            key = f"#{pos}"
+        seen.add(key)
+        keys.append(key)
+    return keys
+
+
+def _profile_meta(name, content, modified, size=None):
+    content = content if isinstance(content, dict) else {}
+    layers = content.get("layers") or []
+    return {
+        "name": name,
+        "nodes": len(content.get("nodeLibrary") or []),
+        "layers": len(layers),
+        "placed": sum(len(l.get("nodes") or []) for l in layers if isinstance(l, dict)),
+        "inbounds": len(content.get("inbounds") or []),
+        "modified": modified,
+        "size": size
+    }
+
+
+class JsonProfileStore:
+    """Profiles as one JSON file per profile in a directory.
+
+    Files are written atomically in the configured format ('pretty', 'compact'
+    or 'gzip'); reads detect gzip transparently, so formats can be mixed.
+    """
+
+    backend = "json"
+
+    def __init__(self, profiles_dir, fmt='pretty'):
+        if fmt not in PROFILE_FORMATS:
+            raise ValueError(f"Unknown profile format: {fmt}")
+        self.profiles_dir = profiles_dir
+        self.fmt = fmt
+        # name -> ((st_mtime_ns, st_size), meta); list() only parses files that changed
+        self._meta = {}
+        ensure_profiles_dir(profiles_dir)
+
+    def _path(self, name):
+        return os.path.join(self.profiles_dir, name)
+
+    def exists(self, name):
+        return os.path.exists(self._path(name))
+
+    def signature(self, name):
+        """Cheap change token for `name` (None if missing)"""
+        path = self._path(name)
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return (path, st.st_mtime_ns, st.st_size)
+
+    def list(self):
+        ensure_profiles_dir(self.profiles_dir)
+        items = []
+        meta = {}
+        for f in sorted(os.listdir(self.profiles_dir)):
+            if not f.endswith('.json'):
+                continue
+            path = self._path(f)
+            try:
+                st = os.stat(path)
+                key = (st.st_mtime_ns, st.st_size)
+                cached = self._meta.get(f)
+                if cached and cached[0] == key:
+                    item = cached[1]
+                else:
+                    item = _profile_meta(f, read_json_file(path), st.st_mtime, st.st_size)
+            except Exception:
+                continue
+            meta[f] = (key, item)
+            items.append(dict(item))
+        # Swapped in whole, which also drops deleted profiles
+        self._meta = meta
+        return items
+
+    def load(self, name):
+        path = self._path(name)
+        if not os.path.exists(path):
+            return None
+        return read_json_file(path)
+
+    def export_json(self, name, fmt='pretty'):
+        """`name` serialized for download (None if missing)"""
+        content = self.load(name)
+        return None if content is None else encode_json(content, fmt)
+
+    def save(self, name, content):
+        write_json_atomic(self._path(name), content, self.fmt)
+        return True
+
+    def patch(self, name, sections):
+        content = self.load(name)
+        if content is None:
+            raise KeyError(name)
+        content.update(sections)
+        return self.save(name, content)
+
+    def create(self, name, content=None):
+        return self.save(name, copy.deepcopy(DEFAULT_PROFILE) if content is None else content)
+
+    def delete(self, name):
+        path = self._path(name)
+        if not os.path.exists(path):
+            return False
+        os.remove(path)
+        return True
+
+
+class SqliteProfileStore:
+    """Profiles stored as rows (one per node, layer and inbound) with an index table.
+
+    JSON files in `profiles_dir` stay compatible: new or newer files are imported
+    on open, and profiles can be exported back to the same JSON shape.
+    """
+
+    backend = "sqlite"
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS profiles (
+            name TEXT PRIMARY KEY,
+            modified REAL NOT NULL,
+            revision INTEGER NOT NULL DEFAULT 0,
+            nodes INTEGER NOT NULL DEFAULT 0,
+            layers INTEGER NOT NULL DEFAULT 0,
+            placed INTEGER NOT NULL DEFAULT 0,
+            inbounds INTEGER NOT NULL DEFAULT 0,
+            size INTEGER NOT NULL DEFAULT 0,
+            extra TEXT NOT NULL DEFAULT '{}',
+            source_mtime REAL
+        );
+        CREATE TABLE IF NOT EXISTS profile_rows (
+            profile TEXT NOT NULL,
+            section TEXT NOT NULL,
+            key TEXT NOT NULL,
+            position INTEGER NOT NULL,
+            digest TEXT NOT NULL,
+            data TEXT NOT NULL,
+            PRIMARY KEY (profile, section, key)
+        );
+        CREATE INDEX IF NOT EXISTS profile_rows_order ON profile_rows (profile, section, position);
+    """
+
+    def __init__(self, db_path, profiles_dir=None):
+        if sqlite3 is None:
+            raise RuntimeError("sqlite3 module is not available")
+        self.db_path = db_path
+        self.profiles_dir = profiles_dir
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(self.SCHEMA)
+        if profiles_dir:
+            self.import_json_dir(profiles_dir)
+        if not self.list():
+            self.create("Default.json")
+
+    # --- Index ---
+
+    def exists(self, name):
+        with self._lock:
+            row = self._conn.execute("SELECT 1 FROM profiles WHERE name = ?", (name,)).fetchone()
+        return row is not None
+
+    def signature(self, name):
+        """Cheap change token for `name` (None if missing)"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT modified, revision, size FROM profiles WHERE name = ?", (name,)
+            ).fetchone()
+        if row is None:
+            return None
+        return (self.db_path, name) + tuple(row)
+
+    def list(self):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT name, nodes, layers, placed, inbounds, modified, size FROM profiles ORDER BY name"
+            ).fetchall()
+        return [
+            {"name": r[0], "nodes": r[1], "layers": r[2], "placed": r[3],
+             "inbounds": r[4], "modified": r[5], "size": r[6]}
+            for r in rows
+        ]
+
+    # --- Read ---
+
+    def load(self, name):
+        with self._lock:
+            head = self._conn.execute("SELECT extra FROM profiles WHERE name = ?", (name,)).fetchone()
+            if head is None:
+                return None
+            rows = self._conn.execute(
+                "SELECT section, data FROM profile_rows WHERE profile = ? ORDER BY section, position",
+                (name,)
+            ).fetchall()
+        content = json.loads(head[0])
+        for section in SECTIONS:
+            content[section] = []
+        for section, data in rows:
+            content.setdefault(section, []).append(json.loads(data))
+        return content
+
+    # --- Write ---
+
+    def _write_section(self, cur, name, section, items):
+        """Diff `items` against stored rows by key; moved items only get a new position"""
+        existing = {
+            key: (pos, digest) for key, pos, digest in cur.execute(
+                "SELECT key, position, digest FROM profile_rows WHERE profile = ? AND section = ?",
+                (name, section)
+            ).fetchall()
+        }
+
+        changed = 0
+        for pos, (key, item) in enumerate(zip(_row_keys(items, SECTIONS[section]), items)):
+            data = _dumps(item)
+            digest = hashlib.sha1(data.encode("utf-8")).hexdigest()
+            old = existing.pop(key, None)
+            if old == (pos, digest):
+                continue
+            if old is not None and old[1] == digest:
+                cur.execute(
+                    "UPDATE profile_rows SET position = ? WHERE profile = ? AND section = ? AND key = ?",
+                    (pos, name, section, key)
+                )
+            else:
+                cur.execute(
+                    "INSERT OR REPLACE INTO profile_rows (profile, section, key, position, digest, data) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (name, section, key, pos, digest, data)
+                )
+            changed += 1
+
+        # Whatever is left was removed from the list
+        if existing:
+            cur.executemany(
+                "DELETE FROM profile_rows WHERE profile = ? AND section = ? AND key = ?",
+                [(name, section, key) for key in existing]
+            )
+            changed += len(existing)
+        return changed
+
+    def _refresh_index(self, cur, name, source_mtime=None):
+        counts = {}
+        size = 0
+        for section in SECTIONS:
+            n, sz = cur.execute(
+                "SELECT COUNT(*), COALESCE(SUM(LENGTH(data)), 0) FROM profile_rows "
+                "WHERE profile = ? AND section = ?",
+                (name, section)
+            ).fetchone()
+            counts[section] = n
+            size += sz
+        placed = 0
+        for (data,) in cur.execute(
+            "SELECT data FROM profile_rows WHERE profile = ? AND section = 'layers'", (name,)
+        ).fetchall():
+            layer = json.loads(data)
+            if isinstance(layer, dict):
+                placed += len(layer.get("nodes") or [])
+        cur.execute(
+            "UPDATE profiles SET modified = ?, revision = revision + 1, nodes = ?, layers = ?, "
+            "placed = ?, inbounds = ?, size = ?, source_mtime = COALESCE(?, source_mtime) WHERE name = ?",
+            (time.time(), counts["nodeLibrary"], counts["layers"], placed,
+             counts["inbounds"], size, source_mtime, name)
+        )
+
+    def _write(self, name, sections, extra=None, source_mtime=None):
+        with self._lock:
+            cur = self._conn.cursor()
+            cur.execute("BEGIN IMMEDIATE")
+            try:
+                cur.execute(
+                    "INSERT OR IGNORE INTO profiles (name, modified) VALUES (?, ?)",
+                    (name, time.time())
+                )
+                changed = 0
+                if extra is not None:
+                    changed += cur.execute(
+                        "UPDATE profiles SET extra = ? WHERE name = ? AND extra != ?",
+                        (_dumps(extra), name, _dumps(extra))
+                    ).rowcount
+                for section, items in sections.items():
+                    changed += self._write_section(cur, name, section, items)
+                if changed or source_mtime is not None:
+                    self._refresh_index(cur, name, source_mtime)
+                cur.execute("COMMIT")
+            except Exception:
+                cur.execute("ROLLBACK")
+                raise
+        return changed
+
+    @staticmethod
+    def _split(content):
+        if not isinstance(content, dict):
+            raise ValueError("Profile content must be an object")
+        sections = {}
+        extra = {}
+        for k, v in content.items():
+            if k in SECTIONS:
+                sections[k] = v if isinstance(v, list) else []
+            else:
+                extra[k] = v
+        for section in SECTIONS:
+            sections.setdefault(section, [])
+        return sections, extra
+
+    def save(self, name, content, source_mtime=None):
+        sections, extra = self._split(content)
+        self._write(name, sections, extra, source_mtime)
+        return True
+
+    def patch(self, name, sections):
+        """Replace only the given sections of an existing profile"""
+        if not self.exists(name):
+            raise KeyError(name)
+        unknown = [s for s in sections if s not in SECTIONS]
+        if unknown:
+            raise ValueError(f"Unknown profile section(s): {', '.join(unknown)}")
+        self._write(name, {s: (v if isinstance(v, list) else []) for s, v in sections.items()})
+        return True
+
+    def create(self, name, content=None):
+        return self.save(name, copy.deepcopy(DEFAULT_PROFILE) if content is None else content)
+
+    def delete(self, name):
+        with self._lock:
+            cur = self._conn.cursor()
+            cur.execute("BEGIN IMMEDIATE")
+            try:
+                cur.execute("DELETE FROM profile_rows WHERE profile = ?", (name,))
+                deleted = cur.execute("DELETE FROM profiles WHERE name = ?", (name,)).rowcount
+                cur.execute("COMMIT")
+            except Exception:
+                cur.execute("ROLLBACK")
+                raise
+        # Remove the JSON copy too, otherwise the next import would resurrect it
+        if self.profiles_dir:
+            path = os.path.join(self.profiles_dir, name)
+            if os.path.exists(path):
+                os.remove(path)
+                deleted = deleted or 1
+        return bool(deleted)
+
+    # --- JSON compatibility ---
+
+    def import_json_dir(self, profiles_dir):
+        """Import JSON profiles that are new or changed since their last import"""
+        if not os.path.isdir(profiles_dir):
+            return []
+        with self._lock:
+            known = dict(self._conn.execute("SELECT name, source_mtime FROM profiles").fetchall())
+        imported = []
+        for f in sorted(os.listdir(profiles_dir)):
+            if not f.endswith('.json'):
+                continue
+            path = os.path.join(profiles_dir, f)
+            mtime = os.stat(path).st_mtime
+            if f in known and (known[f] is None or known[f] >= mtime):
+                continue
+            try:
+                content = read_json_file(path)
+                self.save(f, content, source_mtime=mtime)
+                imported.append(f)
+            except Exception as e:
+                print(f"Warning: failed to import profile {f}: {e}")
+        return imported
+
+    def export_json(self, name, fmt='pretty'):
+        """`name` serialized for download (None if missing)"""
+        content = self.load(name)
+        return None if content is None else encode_json(content, fmt)
+
+
+class ProfileLoadCache:
+    """LRU cache of loaded profiles, pre-serialized for the load API.
+
+    Entries are validated against the store's signature (path + mtime + size for
+    JSON files, revision for SQLite) on every hit, so external edits are picked up.
+    """
+
+    def __init__(self, store, max_entries=16, max_bytes=64 * 1024 * 1024):
+        self.store = store
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # name -> (signature, etag, body)
+        self._bytes = 0
+
+    def get(self, name):
+        """Return (etag, body) for a `{"status": "success", "data": ...}` response, or None"""
+        sig = self.store.signature(name)
+        if sig is None:
+            self.invalidate(name)
+            return None
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry and entry[0] == sig:
+                self._entries.move_to_end(name)
+                PROFILE_CACHE_LOOKUPS.inc("hit")
+                return entry[1], entry[2]
+
+        content = self.store.load(name)
+        if content is None:
+            self.invalidate(name)
+            return None
+        body = json.dumps({"status": "success", "data": content}).encode('utf-8')
+        etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+
+        PROFILE_CACHE_LOOKUPS.inc("miss")
+        with self._lock:
+            self._drop(name)
+            if len(body) <= self.max_bytes:
+                self._entries[name] = (sig, etag, body)
+                self._bytes += len(body)
+                while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                    _, (_sig, _etag, old) = self._entries.popitem(last=False)
+                    self._bytes -= len(old)
+        return etag, body
+
+    def _drop(self, name):
+        entry = self._entries.pop(name, None)
+        if entry:
+            self._bytes -= len(entry[2])
+
+    def invalidate(self, name=None):
+        with self._lock:
+            if name is None:
+                self._entries.clear()
+                self._bytes = 0
+            else:
+                self._drop(name)
+
+
+def open_profile_store(profiles_dir, db_path, backend="sqlite", fmt='pretty'):
+    """Open the configured profile store, falling back to JSON files"""
+    if backend == "sqlite":
+        if sqlite3 is not None:
+            return SqliteProfileStore(db_path, profiles_dir)
+        print("Warning: sqlite3 unavailable, using JSON profile files")
+    return JsonProfileStore(profiles_dir, fmt)
@@ -1,23 +1,267 @@
+import bisect
+import hashlib
 import json
+import os
 import socket
 import socketserver
 import select
 import threading
+import time
+
+import metrics
+
+
+BALANCE_MODES = ("roundrobin", "sticky")
+
+RR_CONNECTIONS = metrics.counter(
+    "singbox_rr_connections_total", "Round-robin relay connections by outcome", ("instance", "group", "backend", "result")
+)
+RR_EJECTIONS = metrics.counter(
+    "singbox_rr_backend_ejections_total", "Round-robin backends ejected after a failed connect", ("instance", "group", "backend")
+)
+RR_BYTES = metrics.counter(
+    "singbox_rr_bytes_total", "Bytes relayed per round-robin backend", ("instance", "group", "backend", "direction")
+)
+RR_ACTIVE = metrics.gauge(
+    "singbox_rr_active_connections", "Open round-robin relay connections", ("instance", "group")
+)
+RR_HANDSHAKE = metrics.histogram(
+    "singbox_rr_handshake_seconds", "Time from accept to SOCKS success reply", ("instance", "group")
+)
+RR_REJECTED = metrics.counter(
+    "singbox_rr_rejected_total", "Round-robin connections shed at accept", ("instance", "group", "reason")
+)
+RR_LIMIT = metrics.gauge(
+    "singbox_rr_connection_limit", "Round-robin concurrency caps (0 = unlimited)", ("scope",),
+    fn=lambda: {
+        ("group",): RRProxyManager.MAX_CONNECTIONS_PER_GROUP,
+        ("global",): RRProxyManager.global_limiter.limit
+    }
+)
+
+
+def _hash64(data):
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """Consistent-hash ring over backend ids, with virtual nodes for even spread.
+
+    Adding or removing a backend only remaps the keys that hashed to it.
+    """
+
+    VNODES = 64
+
+    def __init__(self, backend_ids):
+        points = []
+        for bid in backend_ids:
+            for v in range(self.VNODES):
+                points.append((_hash64(f"{bid}#{v}".encode("utf-8")), bid))
+        points.sort()
+        self._keys = [h for h, _ in points]
+        self._ids = [b for _, b in points]
+
+    def lookup(self, key, skip=()):
+        """First backend clockwise from `key` that is not in `skip`"""
+        n = len(self._keys)
+        if not n:
+            return None
+        i = bisect.bisect(self._keys, _hash64(key))
+        seen = set()
+        for k in range(n):
+            bid = self._ids[(i + k) % n]
+            if bid in seen:
+                continue
+            if bid not in skip:
+                return bid
+            seen.add(bid)
+        return None
+
+
+class PortReservation:
+    """Sockets bound to ports we intend to use, held until `release()`"""
+
+    def __init__(self):
+        self._socks = []
+
+    @staticmethod
+    def _bind(host, port):
+        family = socket.AF_INET6 if ":" in host else socket.AF_INET
+        s = socket.socket(family, socket.SOCK_STREAM)
+        if os.name != "nt":
+            # Match how listeners bind, so TIME_WAIT leftovers don't count as taken
+            s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        try:
+            s.bind((host, port))
+        except OSError:
+            s.close()
+            return None
+        return s
+
+    def try_hold(self, port, host="127.0.0.1"):
+        s = self._bind(host, port)
+        if s is None:
+            return False
+        self._socks.append(s)
+        return True
+
+    def hold_any(self, host="127.0.0.1"):
+        s = self._bind(host, 0)
+        if s is None:
+            raise OSError("No free port available")
+        self._socks.append(s)
+        return s.getsockname()[1]
+
+    def release(self):
+        for s in self._socks:
+            try:
+                s.close()
+            except OSError:
+                pass
+        self._socks = []
+
+
+def port_is_free(port, host="127.0.0.1"):
+    s = PortReservation._bind(host, port)
+    if s is None:
+        return False
+    s.close()
+    return True
+
+
+class ConnectionLimiter:
+    """Concurrency cap that refuses instead of waiting when full (limit 0 = unlimited)"""
+
+    def __init__(self, limit=0):
+        self.limit = limit
+        self._lock = threading.Lock()
+        self.active = 0
+        self.rejected = 0
+
+    def try_acquire(self):
+        with self._lock:
+            if self.limit and self.active >= self.limit:
+                self.rejected += 1
+                return False
+            self.active += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self.active -= 1
+
+    def snapshot(self):
+        with self._lock:
+            return {"max_connections": self.limit, "active": self.active, "rejected": self.rejected}
+
+
+class _RRServer(socketserver.ThreadingTCPServer):
+    """Relay server that admits a connection before giving it a thread.
+
+    A connection over the group or global cap is answered with a SOCKS
+    "no acceptable methods" reply and closed from the accept loop, so a
+    burst costs neither a thread nor a handshake timeout.
+    """
+    allow_reuse_address = os.name != "nt"
+    daemon_threads = True
+
+    def __init__(self, server_address, handler, group_limiter, backlog, on_reject=None):
+        self.group_limiter = group_limiter
+        self.on_reject = on_reject
+        self.request_queue_size = backlog  # read by server_activate() during __init__
+        super().__init__(server_address, handler)
+
+    def process_request(self, request, client_address):
+        if not self.group_limiter.try_acquire():
+            self._reject(request, "group_limit")
+            return
+        if not RRProxyManager.global_limiter.try_acquire():
+            self.group_limiter.release()
+            self._reject(request, "global_limit")
+            return
+        try:
+            super().process_request(request, client_address)
+        except Exception:
+            # Thread creation failed: shed this connection rather than stall the accept loop
+            self._release()
+            self._reject(request, "no_thread")
+
+    def process_request_thread(self, request, client_address):
+        try:
+            super().process_request_thread(request, client_address)
+        finally:
+            self._release()
+
+    def _release(self):
+        self.group_limiter.release()
+        RRProxyManager.global_limiter.release()
+
+    def _reject(self, request, reason):
+        try:
+            request.setblocking(False)
+            request.send(b"\x05\xff")
+        except OSError:
+            pass
+        self.shutdown_request(request)
+        if self.on_reject:
+            self.on_reject(reason)
 
 
 class RRProxyManager:
     RR_PREFIX = 'sys-rr-'
     RR_OUT_SUFFIX = '-lb'
     RR_IN_MARK = '-in-'
+    # A backend that refuses connections is skipped for this long
+    EJECT_SECONDS = 30
+    MAX_ATTEMPTS = 3
+    # Admission limits; main.py overrides them from the environment via configure_limits()
+    MAX_CONNECTIONS_PER_GROUP = 256
+    BACKLOG = 128
+    # Whole SOCKS handshake (client greeting through upstream reply) must finish within this
+    HANDSHAKE_TIMEOUT = 10.0
+    # Shared by every group of every manager in the process
+    global_limiter = ConnectionLimiter(1024)
 
-    def __init__(self):
+    @classmethod
+    def configure_limits(cls, per_group=None, total=None, backlog=None, handshake_timeout=None):
+        """Set the caps used by relays started from now on (the global cap applies immediately)"""
+        if per_group is not None:
+            cls.MAX_CONNECTIONS_PER_GROUP = per_group
+        if total is not None:
+            cls.global_limiter.limit = total
+        if backlog is not None:
+            cls.BACKLOG = backlog
+        if handshake_timeout is not None:
+            cls.HANDSHAKE_TIMEOUT = handshake_timeout
+
+    @classmethod
+    def limits(cls):
+        return {
+            **cls.global_limiter.snapshot(),
+            "max_connections_per_group": cls.MAX_CONNECTIONS_PER_GROUP,
+            "backlog": cls.BACKLOG,
+            "handshake_timeout": cls.HANDSHAKE_TIMEOUT
+        }
+
+    def __init__(self, instance="default"):
+        self.instance = instance
         self._lock = threading.Lock()
         self._servers = {}  # group_id -> (server, thread)
+        self._groups = []
+        self._limiters = {}  # group_id -> ConnectionLimiter
+        # Optional callback run on a relay thread when a backend is ejected: on_eject(group_id, backend_id)
+        self.on_eject = None
 
     @staticmethod
-    def _recv_exact(sock_obj, n):
+    def _recv_exact(sock_obj, n, deadline=None):
+        """Read exactly n bytes; with a monotonic `deadline`, time out when it passes"""
         buf = b""
         while len(buf) < n:
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise socket.timeout("handshake deadline exceeded")
+                sock_obj.settimeout(remaining)
             chunk = sock_obj.recv(n - len(buf))
             if not chunk:
                 raise ConnectionError("Unexpected EOF")
@@ -25,29 +269,48 @@ class RRProxyManager:
         return buf
 
     @staticmethod
-    def _read_socks_addr(sock_obj, atyp):
+    def _read_socks_addr(sock_obj, atyp, deadline=None):
         if atyp == 1:  # IPv4
-            data = RRProxyManager._recv_exact(sock_obj, 4)
+            data = RRProxyManager._recv_exact(sock_obj, 4, deadline)
             return data
         if atyp == 3:  # Domain
-            ln = RRProxyManager._recv_exact(sock_obj, 1)[0]
-            data = RRProxyManager._recv_exact(sock_obj, ln)
+            ln = RRProxyManager._recv_exact(sock_obj, 1, deadline)[0]
+            data = RRProxyManager._recv_exact(sock_obj, ln, deadline)
             return bytes([ln]) + data
         if atyp == 4:  # IPv6
-            data = RRProxyManager._recv_exact(sock_obj, 16)
+            data = RRProxyManager._recv_exact(sock_obj, 16, deadline)
             return data
         raise ValueError("Unsupported ATYP")
 
     @staticmethod
-    def _consume_socks_addr(sock_obj, atyp):
-        RRProxyManager._read_socks_addr(sock_obj, atyp)
+    def _consume_socks_addr(sock_obj, atyp, deadline=None):
+        RRProxyManager._read_socks_addr(sock_obj, atyp, deadline)
 
     @staticmethod
     def _send_socks_reply(sock_obj, rep):
         sock_obj.sendall(b"\x05" + bytes([rep]) + b"\x00\x01\x00\x00\x00\x00\x00\x00")
 
+    @staticmethod
+    def _socks_connect(upstream, atyp, addr_raw, port_raw, deadline=None):
+        """CONNECT through a SOCKS5 backend; returns its reply code (0 = success)"""
+        upstream.sendall(b"\x05\x01\x00")
+        resp = RRProxyManager._recv_exact(upstream, 2, deadline)
+        if resp[0] != 5 or resp[1] != 0:
+            return 1
+        upstream.sendall(b"\x05\x01\x00" + bytes([atyp]) + addr_raw + port_raw)
+        rep = RRProxyManager._recv_exact(upstream, 4, deadline)
+        if rep[0] != 5:
+            return 1
+        if rep[1] != 0:
+            return rep[1]
+        RRProxyManager._consume_socks_addr(upstream, rep[3], deadline)
+        RRProxyManager._recv_exact(upstream, 2, deadline)
+        return 0
+
     @staticmethod
     def _relay_tcp(a, b):
+        """Pump bytes both ways until either side closes; returns (a->b, b->a) byte counts"""
+        sent = {a: 0, b: 0}
         try:
             a.settimeout(None)
             b.settimeout(None)
@@ -56,10 +319,11 @@ class RRProxyManager:
                 for s in r:
                     data = s.recv(65536)
                     if not data:
-                        return
+                        return sent[a], sent[b]
                     (b if s is a else a).sendall(data)
+                    sent[s] += len(data)
         except Exception:
-            return
+            return sent[a], sent[b]
 
     @classmethod
     def _extract_groups(cls, config):
@@ -120,33 +384,144 @@ class RRProxyManager:
 
         return groups
 
+    @classmethod
+    def _rr_port_slots(cls, config):
+        """(holder dict, key) pairs for every sys-rr-* port in the config"""
+        slots = []
+        for o in config.get("outbounds") or []:
+            if (isinstance(o, dict) and isinstance(o.get("tag"), str)
+                    and o["tag"].startswith(cls.RR_PREFIX) and o["tag"].endswith(cls.RR_OUT_SUFFIX)
+                    and isinstance(o.get("server_port"), int)):
+                slots.append((o, "server_port"))
+        for ib in config.get("inbounds") or []:
+            if (isinstance(ib, dict) and isinstance(ib.get("tag"), str)
+                    and ib["tag"].startswith(cls.RR_PREFIX) and isinstance(ib.get("listen_port"), int)):
+                slots.append((ib, "listen_port"))
+        return slots
+
+    @classmethod
+    def plan_ports(cls, config, check_free=True, reserved=None):
+        """Assign RR ports in `config` in place and report port conflicts.
+
+        User inbounds keep their ports; duplicates, clashes with `reserved`
+        ({port: owner}) and (with `check_free`) ports bound by other processes
+        are reported as conflicts. RR ports keep their current value when usable
+        and are otherwise moved to a free loopback port. Returns
+        (report, reservation); the caller must `release()` the reservation right
+        before binding the listeners.
+        """
+        reserved = reserved or {}
+        conflicts = []
+        owners = {}
+        for ib in config.get("inbounds") or []:
+            if not isinstance(ib, dict) or not isinstance(ib.get("listen_port"), int):
+                continue
+            tag = ib.get("tag") if isinstance(ib.get("tag"), str) else "?"
+            if tag.startswith(cls.RR_PREFIX):
+                continue
+            port = ib["listen_port"]
+            if port in owners:
+                conflicts.append({"port": port, "tag": tag, "reason": f"also used by inbound {owners[port]}"})
+                continue
+            owners[port] = tag
+            if port in reserved:
+                conflicts.append({"port": port, "tag": tag, "reason": f"used by {reserved[port]}"})
+            elif check_free and not port_is_free(port, ib.get("listen") or "127.0.0.1"):
+                conflicts.append({"port": port, "tag": tag, "reason": "already in use by another process"})
+
+        reservation = PortReservation()
+        remapped = {}
+        taken = set(owners) | set(reserved)
+        try:
+            for holder, key in cls._rr_port_slots(config):
+                port = holder[key]
+                usable = port not in taken and (not check_free or reservation.try_hold(port))
+                if not usable:
+                    new_port = reservation.hold_any()
+                    while new_port in taken:
+                        new_port = reservation.hold_any()
+                    remapped[port] = new_port
+                    holder[key] = new_port
+                    port = new_port
+                taken.add(port)
+        except Exception:
+            reservation.release()
+            raise
+
+        report = {"conflicts": conflicts, "remapped": remapped}
+        return report, reservation
+
     @staticmethod
-    def _make_handler(backend_ports):
+    def format_conflicts(conflicts):
+        return "; ".join(f"port {c['port']} ({c['tag']}): {c['reason']}" for c in conflicts)
+
+    @classmethod
+    def _make_handler(cls, backend_ports, balance="roundrobin", backend_ids=None, group_id="", on_eject=None,
+                      instance="default"):
         ports = list(backend_ports)
+        # Ring members are stable ids (candidate tags when known) so a port
+        # reassignment or a removed candidate does not reshuffle every key
+        ids = list(backend_ids) if backend_ids and len(backend_ids) == len(ports) else [str(i) for i in range(len(ports))]
+        id_to_port = dict(zip(ids, ports))
+        ring = HashRing(ids) if balance == "sticky" else None
         lock = threading.Lock()
         state = {"i": 0}
+        ejected = {}  # backend id -> monotonic deadline
+
+        def live_skip(tried):
+            now = time.monotonic()
+            skip = set(tried)
+            for bid, until in list(ejected.items()):
+                if until > now:
+                    skip.add(bid)
+                else:
+                    ejected.pop(bid, None)
+            # If everything is ejected, fall back to trying them anyway
+            if len(skip) >= len(ids):
+                skip = set(tried)
+            return skip
 
-        def pick_backend():
+        def pick_backend(key, tried):
+            skip = live_skip(tried)
+            if ring is not None:
+                return ring.lookup(key, skip)
             with lock:
-                i = state["i"]
-                state["i"] = (i + 1) % len(ports)
-                return ports[i]
+                for _ in range(len(ids)):
+                    i = state["i"]
+                    state["i"] = (i + 1) % len(ids)
+                    if ids[i] not in skip:
+                        return ids[i]
+            return None
+
+        def eject(bid):
+            ejected[bid] = time.monotonic() + cls.EJECT_SECONDS
+            RR_EJECTIONS.inc(instance, group_id, bid)
+            if on_eject:
+                try:
+                    on_eject(group_id, bid)
+                except Exception:
+                    pass
 
         class Handler(socketserver.BaseRequestHandler):
             def handle(self):
                 client = self.request
                 upstream = None
+                bid = "none"
+                result = "client_error"
+                accepted = time.perf_counter()
+                RR_ACTIVE.inc(instance, group_id)
+                # One absolute deadline for the whole handshake, so a client
+                # trickling bytes cannot hold the thread past it
+                deadline = time.monotonic() + cls.HANDSHAKE_TIMEOUT
                 try:
-                    client.settimeout(10)
-
-                    hdr = RRProxyManager._recv_exact(client, 2)
+                    hdr = RRProxyManager._recv_exact(client, 2, deadline)
                     if hdr[0] != 5:
                         return
                     nmethods = hdr[1]
-                    RRProxyManager._recv_exact(client, nmethods)
+                    RRProxyManager._recv_exact(client, nmethods, deadline)
                     client.sendall(b"\x05\x00")
 
-                    req = RRProxyManager._recv_exact(client, 4)
+                    req = RRProxyManager._recv_exact(client, 4, deadline)
                     if req[0] != 5:
                         return
                     cmd = req[1]
@@ -155,34 +530,68 @@ class RRProxyManager:
                         RRProxyManager._send_socks_reply(client, 7)
                         return
 
-                    addr_raw = RRProxyManager._read_socks_addr(client, atyp)
-                    port_raw = RRProxyManager._recv_exact(client, 2)
-
-                    backend_port = pick_backend()
-                    upstream = socket.create_connection(("127.0.0.1", backend_port), timeout=10)
-
-                    upstream.sendall(b"\x05\x01\x00")
-                    resp = RRProxyManager._recv_exact(upstream, 2)
-                    if resp[0] != 5 or resp[1] != 0:
-                        RRProxyManager._send_socks_reply(client, 1)
-                        return
+                    addr_raw = RRProxyManager._read_socks_addr(client, atyp, deadline)
+                    port_raw = RRProxyManager._recv_exact(client, 2, deadline)
 
-                    upstream.sendall(b"\x05\x01\x00" + bytes([atyp]) + addr_raw + port_raw)
-                    rep = RRProxyManager._recv_exact(upstream, 4)
-                    if rep[0] != 5:
-                        RRProxyManager._send_socks_reply(client, 1)
-                        return
-                    if rep[1] != 0:
-                        RRProxyManager._send_socks_reply(client, rep[1])
+                    # Sticky mode keys on the destination host, so every port of
+                    # a site (and its TLS/HTTP2 sessions) leaves via the same exit
+                    key = bytes([atyp]) + addr_raw
+                    tried = []
+                    rep = 1
+                    # A backend counts as failed (and is ejected) whether it refuses
+                    # the TCP connect or answers the CONNECT with an error reply
+                    while upstream is None and len(tried) < min(len(ids), cls.MAX_ATTEMPTS):
+                        bid = pick_backend(key, tried)
+                        if bid is None:
+                            break
+                        tried.append(bid)
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            raise socket.timeout("handshake deadline exceeded")
+                        try:
+                            upstream = socket.create_connection(("127.0.0.1", id_to_port[bid]), timeout=remaining)
+                        except socket.timeout:
+                            raise
+                        except OSError:
+                            result, rep = "connect_error", 1
+                            eject(bid)
+                            continue
+                        try:
+                            rep = RRProxyManager._socks_connect(upstream, atyp, addr_raw, port_raw, deadline)
+                        except socket.timeout:
+                            raise
+                        except (OSError, ValueError):
+                            rep = 1
+                        if rep != 0:
+                            result = "upstream_error"
+                            upstream.close()
+                            upstream = None
+                            eject(bid)
+                    if upstream is None:
+                        bid = tried[-1] if tried else "none"
+                        if not tried:
+                            result = "connect_error"
+                        RRProxyManager._send_socks_reply(client, rep)
                         return
-                    RRProxyManager._consume_socks_addr(upstream, rep[3])
-                    RRProxyManager._recv_exact(upstream, 2)
 
                     RRProxyManager._send_socks_reply(client, 0)
-                    RRProxyManager._relay_tcp(client, upstream)
+                    RR_HANDSHAKE.observe(time.perf_counter() - accepted, instance, group_id)
+                    result = "ok"
+                    up, down = RRProxyManager._relay_tcp(client, upstream)
+                    RR_BYTES.inc(instance, group_id, bid, "up", amount=up)
+                    RR_BYTES.inc(instance, group_id, bid, "down", amount=down)
+                except socket.timeout:
+                    if result != "ok":
+                        result = "handshake_timeout"
+                        try:
+                            RRProxyManager._send_socks_reply(client, 1)
+                        except OSError:
+                            pass
                 except Exception:
                     return
                 finally:
+                    RR_ACTIVE.dec(instance, group_id)
+                    RR_CONNECTIONS.inc(instance, group_id, bid, result)
                     try:
                         if upstream:
                             upstream.close()
@@ -191,10 +600,17 @@ class RRProxyManager:
 
         return Handler
 
+    def status(self):
+        """Running groups: [{"id", "listen_port", "backend_ports", "balance", "max_connections", "active", "rejected"}]"""
+        with self._lock:
+            return [{**g, **self._limiters[g["id"]].snapshot()} for g in self._groups]
+
     def stop_all(self):
         with self._lock:
             servers = list(self._servers.values())
             self._servers.clear()
+            self._groups = []
+            self._limiters = {}
         for server, _thread in servers:
             try:
                 server.shutdown()
@@ -205,8 +621,14 @@ class RRProxyManager:
             except Exception:
                 pass
 
-    def start_from_config(self, config_path):
+    def _reject_counter(self, group_id):
+        instance = self.instance
+        return lambda reason: RR_REJECTED.inc(instance, group_id, reason)
+
+    def start_from_config(self, config_path, group_options=None):
+        """Start one relay per RR group; `group_options` maps group id -> {"balance", "backends"}"""
         self.stop_all()
+        group_options = group_options or {}
 
         with open(config_path, "r", encoding="utf-8") as f:
             config = json.load(f)
@@ -220,14 +642,22 @@ class RRProxyManager:
             for g in groups:
                 listen_port = g["listen_port"]
                 backend_ports = g["backend_ports"]
-                handler = self._make_handler(backend_ports)
-                server = socketserver.ThreadingTCPServer(("127.0.0.1", listen_port), handler)
-                server.daemon_threads = True
+                opts = group_options.get(g["id"]) or {}
+                balance = opts.get("balance") if opts.get("balance") in BALANCE_MODES else "roundrobin"
+                g["balance"] = balance
+                handler = self._make_handler(
+                    backend_ports, balance, opts.get("backends"), g["id"], self.on_eject, self.instance
+                )
+                limiter = ConnectionLimiter(self.MAX_CONNECTIONS_PER_GROUP)
+                server = _RRServer(
+                    ("127.0.0.1", listen_port), handler, limiter, self.BACKLOG,
+                    on_reject=self._reject_counter(g["id"])
+                )
                 t = threading.Thread(target=server.serve_forever, daemon=True)
                 t.start()
-                started.append((g["id"], server, t))
+                started.append((g["id"], server, t, limiter))
         except Exception:
-            for _gid, server, _t in started:
+            for _gid, server, _t, _limiter in started:
                 try:
                     server.shutdown()
                 except Exception:
@@ -239,7 +669,9 @@ class RRProxyManager:
             raise
 
         with self._lock:
-            for gid, server, t in started:
+            for gid, server, t, limiter in started:
                 self._servers[gid] = (server, t)
+                self._limiters[gid] = limiter
+            self._groups = [dict(g) for g in groups]
 
         return groups
\ No newline at end of file
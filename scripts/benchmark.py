@@ -0,0 +1,475 @@
+"""Reproducible benchmarks for the round-robin relay and the control-plane API.
+
+    python scripts/benchmark.py rr  --concurrency 32 --connections 2000 --payload 16384
+    python scripts/benchmark.py api --pollers 8 --iterations 200
+    python scripts/benchmark.py rr --json after.json --compare before.json
+
+Everything runs locally: the RR benchmark stands up an echo target and SOCKS5
+stand-in backends in-process; the API benchmark launches main.py from a
+temporary copy of the tree (with a stub core binary) on a free port.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import socket
+import socketserver
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+from proxy_manager import RRProxyManager  # noqa: E402
+
+# Metrics where a larger value is better; everything else is "lower is better"
+HIGHER_IS_BETTER = {"connections_per_s", "mb_per_s", "requests_per_s"}
+
+
+# --- Helpers ---
+
+def free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * pct / 100.0
+    lo = int(k)
+    hi = min(lo + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+
+def latency_summary(samples_s):
+    ms = [s * 1000 for s in samples_s]
+    return {
+        "count": len(ms),
+        "p50_ms": round(percentile(ms, 50), 3) if ms else None,
+        "p99_ms": round(percentile(ms, 99), 3) if ms else None,
+        "max_ms": round(max(ms), 3) if ms else None,
+    }
+
+
+def rss_kb(pid=None):
+    """Current resident set size in KiB (Linux /proc), falling back to peak RSS"""
+    status = f"/proc/{pid or 'self'}/status"
+    try:
+        with open(status) as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    if pid is None:
+        try:
+            import resource
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            return peak // 1024 if platform.system() == "Darwin" else peak
+        except ImportError:
+            return None
+    return None
+
+
+# --- Local stand-ins ---
+
+class EchoHandler(socketserver.BaseRequestHandler):
+    """Echo target: sends back everything it receives"""
+
+    def handle(self):
+        try:
+            while True:
+                data = self.request.recv(65536)
+                if not data:
+                    return
+                self.request.sendall(data)
+        except OSError:
+            return
+
+
+class SocksBackendHandler(socketserver.BaseRequestHandler):
+    """Minimal no-auth SOCKS5 CONNECT server standing in for a sing-box inbound"""
+
+    def handle(self):
+        client = self.request
+        upstream = None
+        try:
+            hdr = RRProxyManager._recv_exact(client, 2)
+            RRProxyManager._recv_exact(client, hdr[1])
+            client.sendall(b"\x05\x00")
+            req = RRProxyManager._recv_exact(client, 4)
+            addr_raw = RRProxyManager._read_socks_addr(client, req[3])
+            port = int.from_bytes(RRProxyManager._recv_exact(client, 2), "big")
+            if req[3] == 1:
+                host = socket.inet_ntoa(addr_raw)
+            elif req[3] == 3:
+                host = addr_raw[1:].decode("idna")
+            else:
+                host = socket.inet_ntop(socket.AF_INET6, addr_raw)
+            upstream = socket.create_connection((host, port), timeout=10)
+            RRProxyManager._send_socks_reply(client, 0)
+            RRProxyManager._relay_tcp(client, upstream)
+        except Exception:
+            return
+        finally:
+            if upstream:
+                upstream.close()
+
+
+def start_server(handler):
+    server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    server.request_queue_size = 1024
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+# --- RR relay benchmark ---
+
+def socks_handshake(sock_obj, port):
+    sock_obj.sendall(b"\x05\x01\x00")
+    resp = RRProxyManager._recv_exact(sock_obj, 2)
+    if resp != b"\x05\x00":
+        raise ConnectionError("method negotiation failed")
+    sock_obj.sendall(b"\x05\x01\x00\x01" + socket.inet_aton("127.0.0.1") + port.to_bytes(2, "big"))
+    rep = RRProxyManager._recv_exact(sock_obj, 10)
+    if rep[1] != 0:
+        raise ConnectionError(f"connect failed (rep={rep[1]})")
+
+
+def run_rr(args):
+    echo = start_server(EchoHandler)
+    echo_port = echo.server_address[1]
+    backends = [start_server(SocksBackendHandler) for _ in range(args.backends)]
+    listen_port = free_port()
+
+    config = {
+        "inbounds": [
+            {"type": "socks", "tag": f"sys-rr-bench-in-{i}", "listen": "127.0.0.1",
+             "listen_port": b.server_address[1]}
+            for i, b in enumerate(backends)
+        ],
+        "outbounds": [
+            {"type": "socks", "tag": "sys-rr-bench-lb", "server": "127.0.0.1",
+             "server_port": listen_port, "version": "5"}
+        ]
+    }
+    work_dir = tempfile.mkdtemp(prefix="rr-bench-")
+    config_path = os.path.join(work_dir, "config.json")
+    with open(config_path, "w") as f:
+        json.dump(config, f)
+
+    manager = RRProxyManager()
+    manager.start_from_config(config_path)
+
+    payload = os.urandom(args.payload) if args.payload else b""
+    handshakes = []
+    errors = [0]
+    total_bytes = [0]
+    lock = threading.Lock()
+    remaining = [args.connections]
+
+    def take():
+        with lock:
+            if remaining[0] <= 0:
+                return False
+            remaining[0] -= 1
+            return True
+
+    def worker():
+        local_hs = []
+        local_bytes = 0
+        local_err = 0
+        while take():
+            s = None
+            try:
+                t0 = time.perf_counter()
+                s = socket.create_connection(("127.0.0.1", listen_port), timeout=10)
+                socks_handshake(s, echo_port)
+                local_hs.append(time.perf_counter() - t0)
+                for _ in range(args.requests_per_conn):
+                    if not payload:
+                        break
+                    s.sendall(payload)
+                    RRProxyManager._recv_exact(s, len(payload))
+                    local_bytes += 2 * len(payload)
+            except Exception:
+                local_err += 1
+            finally:
+                if s:
+                    s.close()
+        with lock:
+            handshakes.extend(local_hs)
+            total_bytes[0] += local_bytes
+            errors[0] += local_err
+
+    rss_before = rss_kb()
+    t_start = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(args.concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - t_start
+    rss_after = rss_kb()
+
+    manager.stop_all()
+    for srv in [echo] + backends:
+        srv.shutdown()
+        srv.server_close()
+    shutil.rmtree(work_dir, ignore_errors=True)
+
+    ok = len(handshakes)
+    return {
+        "benchmark": "rr",
+        "params": {
+            "concurrency": args.concurrency,
+            "connections": args.connections,
+            "payload": args.payload,
+            "requests_per_conn": args.requests_per_conn,
+            "backends": args.backends,
+        },
+        "metrics": {
+            "elapsed_s": round(elapsed, 3),
+            "connections_per_s": round(ok / elapsed, 1) if elapsed else None,
+            "mb_per_s": round(total_bytes[0] / elapsed / 1e6, 3) if elapsed else None,
+            "handshake_p50_ms": latency_summary(handshakes)["p50_ms"],
+            "handshake_p99_ms": latency_summary(handshakes)["p99_ms"],
+            "errors": errors[0],
+            "rss_kb": rss_after,
+            "rss_delta_kb": (rss_after - rss_before) if rss_before and rss_after else None,
+        }
+    }
+
+
+# --- Control-plane API benchmark ---
+
+STUB_CORE = """#!/bin/sh
+if [ "$1" = "check" ]; then echo "stub check ok"; exit 0; fi
+exec sleep 3600
+"""
+
+
+def launch_server(port):
+    """Start main.py from a temporary copy of the tree so real configs are untouched"""
+    if platform.system() == "Windows":
+        raise RuntimeError("Self-hosted API benchmark needs a POSIX shell; pass --url instead")
+    work_dir = tempfile.mkdtemp(prefix="api-bench-")
+    for name in os.listdir(BASE_DIR):
+        if name.endswith(".py"):
+            shutil.copy2(os.path.join(BASE_DIR, name), work_dir)
+    shutil.copytree(os.path.join(BASE_DIR, "web"), os.path.join(work_dir, "web"))
+    bin_dir = os.path.join(work_dir, "bin")
+    os.makedirs(bin_dir)
+    stub = os.path.join(bin_dir, "sing-box")
+    with open(stub, "w") as f:
+        f.write(STUB_CORE)
+    os.chmod(stub, 0o755)
+
+    env = os.environ.copy()
+    env["SINGBOX_EDITOR_PORT"] = str(port)
+    proc = subprocess.Popen(
+        [sys.executable, "main.py"], cwd=work_dir, env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    deadline = time.monotonic() + 15
+    while time.monotonic() < deadline:
+        try:
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/api/profiles/list", timeout=1).read()
+            return proc, work_dir
+        except OSError:
+            if proc.poll() is not None:
+                break
+            time.sleep(0.1)
+    proc.kill()
+    shutil.rmtree(work_dir, ignore_errors=True)
+    raise RuntimeError("API server did not come up")
+
+
+def make_profile(nodes):
+    library = [{"id": "lib-direct", "tag": "direct", "type": "direct"}]
+    placed = []
+    for i in range(nodes):
+        tag = f"bench-{i}"
+        library.append({
+            "id": f"lib-{i}", "tag": tag, "type": "shadowsocks", "server": f"10.0.{i // 250}.{i % 250}",
+            "port": 8388, "password": "bench-password", "method": "aes-256-gcm"
+        })
+        placed.append({"id": f"p-{i}", "tag": tag, "detours": []})
+    return {
+        "inbounds": [{"tag": "mixed-10808", "type": "mixed", "port": 10808,
+                      "detours": [placed[0]["tag"]] if placed else [], "selectorDefault": None}],
+        "nodeLibrary": library,
+        "layers": [{"id": "layer-1", "title": "HOP 1", "nodes": placed}],
+    }
+
+
+def api_call(base, method, path, body=None):
+    data = json.dumps(body).encode("utf-8") if body is not None else None
+    req = urllib.request.Request(base + path, data=data, method=method,
+                                 headers={"Content-Type": "application/json"})
+    t0 = time.perf_counter()
+    with urllib.request.urlopen(req, timeout=30) as resp:
+        resp.read()
+    return time.perf_counter() - t0
+
+
+def run_api(args):
+    proc = work_dir = None
+    base = args.url.rstrip("/") if args.url else None
+    if not base:
+        port = free_port()
+        proc, work_dir = launch_server(port)
+        base = f"http://127.0.0.1:{port}"
+
+    profile_name = "bench-profile.json"
+    content = make_profile(args.nodes)
+    samples = {"save": [], "load": [], "status": [], "poll": []}
+    errors = [0]
+    stop = threading.Event()
+
+    def poller():
+        while not stop.is_set():
+            try:
+                samples["poll"].append(api_call(base, "POST", "/api/status"))
+            except Exception:
+                errors[0] += 1
+            stop.wait(args.poll_interval)
+
+    try:
+        api_call(base, "POST", "/api/profiles/create", {"name": profile_name})
+        pollers = [threading.Thread(target=poller, daemon=True) for _ in range(args.pollers)]
+        for t in pollers:
+            t.start()
+
+        t_start = time.perf_counter()
+        for i in range(args.iterations):
+            # Touch one node per iteration so saves are real changes
+            content["nodeLibrary"][1 + i % max(1, args.nodes)]["port"] = 8000 + i % 1000
+            for key, method, path, body in (
+                ("save", "POST", "/api/profiles/save", {"name": profile_name, "content": content}),
+                ("load", "GET", f"/api/profiles/load?name={profile_name}", None),
+                ("status", "POST", "/api/status", None),
+            ):
+                try:
+                    samples[key].append(api_call(base, method, path, body))
+                except Exception:
+                    errors[0] += 1
+        elapsed = time.perf_counter() - t_start
+        stop.set()
+        for t in pollers:
+            t.join(timeout=5)
+        server_rss = rss_kb(proc.pid) if proc else None
+        try:
+            api_call(base, "POST", "/api/profiles/delete", {"name": profile_name})
+        except Exception:
+            pass
+    finally:
+        stop.set()
+        if proc:
+            proc.terminate()
+            try:
+                proc.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+        if work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    metrics = {"elapsed_s": round(elapsed, 3), "errors": errors[0], "server_rss_kb": server_rss}
+    total = 0
+    for key, values in samples.items():
+        summary = latency_summary(values)
+        total += summary["count"]
+        metrics[f"{key}_p50_ms"] = summary["p50_ms"]
+        metrics[f"{key}_p99_ms"] = summary["p99_ms"]
+    metrics["requests_per_s"] = round(total / elapsed, 1) if elapsed else None
+    return {
+        "benchmark": "api",
+        "params": {
+            "iterations": args.iterations,
+            "nodes": args.nodes,
+            "pollers": args.pollers,
+            "poll_interval": args.poll_interval,
+            "url": args.url,
+        },
+        "metrics": metrics
+    }
+
+
+# --- Reporting ---
+
+def compare(result, baseline, threshold):
+    """Print per-metric deltas against a previous run; returns number of regressions"""
+    regressions = 0
+    base_metrics = baseline.get("metrics", {})
+    print(f"\nComparison against baseline (threshold {threshold:.0%}):")
+    for key, value in result["metrics"].items():
+        old = base_metrics.get(key)
+        if not isinstance(value, (int, float)) or not isinstance(old, (int, float)) or not old:
+            continue
+        change = (value - old) / old
+        worse = change < -threshold if key in HIGHER_IS_BETTER else change > threshold
+        if key in ("errors",):
+            worse = value > old
+        regressions += int(worse)
+        flag = "  REGRESSION" if worse else ""
+        print(f"  {key:<22} {old:>12} -> {value:<12} ({change:+.1%}){flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the RR relay and control-plane API")
+    sub = parser.add_subparsers(dest="benchmark", required=True)
+
+    rr = sub.add_parser("rr", help="Round-robin SOCKS5 relay throughput and handshake latency")
+    rr.add_argument("--concurrency", type=int, default=16, help="Concurrent client workers")
+    rr.add_argument("--connections", type=int, default=1000, help="Total connections to open")
+    rr.add_argument("--payload", type=int, default=16384, help="Bytes echoed per request (0 = handshake only)")
+    rr.add_argument("--requests-per-conn", type=int, default=1,
+                    help="Payload round trips per connection (1 = full connection churn)")
+    rr.add_argument("--backends", type=int, default=4, help="SOCKS5 stand-in backends in the group")
+
+    api = sub.add_parser("api", help="Profile save/load and status latency under concurrent polling")
+    api.add_argument("--url", help="Benchmark an already running server instead of a temporary one")
+    api.add_argument("--iterations", type=int, default=100, help="save/load/status rounds")
+    api.add_argument("--nodes", type=int, default=500, help="Library nodes in the benchmark profile")
+    api.add_argument("--pollers", type=int, default=4, help="Concurrent /api/status pollers")
+    api.add_argument("--poll-interval", type=float, default=0.1, help="Seconds between polls per poller")
+
+    for p in (rr, api):
+        p.add_argument("--json", help="Write machine-readable results to this file")
+        p.add_argument("--compare", help="Baseline JSON from a previous run to compare against")
+        p.add_argument("--threshold", type=float, default=0.10, help="Relative change counted as a regression")
+
+    args = parser.parse_args()
+    result = run_rr(args) if args.benchmark == "rr" else run_api(args)
+    result["env"] = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": time.time(),
+    }
+
+    print(json.dumps(result, indent=2))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(result, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline.get("benchmark") != result["benchmark"]:
+            print("Baseline is from a different benchmark; skipping comparison")
+        elif compare(result, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+import hashlib
+import mimetypes
+import os
+import re
+from collections import namedtuple
+from urllib.parse import unquote
+
+try:
+    import brotli
+except ImportError:  # optional: only gzip variants are built without it
+    brotli = None
+
+from config_handler import gzip_bytes
+
+
+Asset = namedtuple("Asset", "body gzip br etag version content_type")
+
+COMPRESSIBLE_TYPES = (
+    "text/",
+    "application/javascript",
+    "application/json",
+    "image/svg+xml",
+)
+# Bodies smaller than this rarely shrink enough to pay for the header
+MIN_COMPRESS_SIZE = 512
+LONG_CACHE = "public, max-age=31536000, immutable"
+BUNDLE_PATH = "/js/bundle.js"
+
+# href="css/style.css?v=12" / src="js/app.js" -> local, relative asset references
+ASSET_REF_RE = re.compile(r'(?P<attr>\b(?:src|href))="(?P<path>(?!https?:|//|data:|#)[^"?#]+)(?:\?[^"#]*)?"')
+SCRIPT_TAG_RE = re.compile(r'[ \t]*<script src="(?P<path>(?!https?:|//)[^"?#]+)(?:\?[^"#]*)?"></script>\n?')
+
+
+def _content_type(path):
+    if path.endswith(".js"):
+        return "application/javascript; charset=utf-8"
+    ctype = mimetypes.guess_type(path)[0] or "application/octet-stream"
+    if ctype.startswith("text/"):
+        ctype += "; charset=utf-8"
+    return ctype
+
+
+def _make_asset(path, body):
+    ctype = _content_type(path)
+    digest = hashlib.sha256(body).hexdigest()
+    gz = br = None
+    if len(body) >= MIN_COMPRESS_SIZE and ctype.startswith(COMPRESSIBLE_TYPES):
+        gz = gzip_bytes(body, compresslevel=9)
+        if len(gz) >= len(body):
+            gz = None
+        if brotli is not None:
+            br = brotli.compress(body, quality=11)
+            if len(br) >= len(body):
+                br = None
+    return Asset(body, gz, br, f'"{digest[:32]}"', digest[:12], ctype)
+
+
+class StaticAssetCache:
+    """Web assets loaded once at startup, with precompressed variants.
+
+    index.html is rewritten so every local asset URL carries `?v=<content hash>`;
+    such versioned requests are served as immutable, everything else revalidates.
+    With `bundle_js`, the page's scripts are concatenated (in order) into one file.
+    """
+
+    def __init__(self, web_dir, bundle_js=False):
+        self.web_dir = web_dir
+        self.bundle_js = bundle_js
+        self.assets = {}
+        self.build()
+
+    def build(self):
+        assets = {}
+        for root, _dirs, files in os.walk(self.web_dir):
+            for fname in files:
+                full = os.path.join(root, fname)
+                rel = "/" + os.path.relpath(full, self.web_dir).replace(os.sep, "/")
+                with open(full, "rb") as f:
+                    assets[rel] = f.read()
+
+        index = assets.pop("/index.html", None)
+        built = {path: _make_asset(path, body) for path, body in assets.items()}
+
+        if index is not None:
+            html = index.decode("utf-8")
+            if self.bundle_js:
+                html, bundle = self._bundle_scripts(html, assets)
+                if bundle is not None:
+                    built[BUNDLE_PATH] = _make_asset(BUNDLE_PATH, bundle)
+            html = self._version_refs(html, built)
+            built["/index.html"] = _make_asset("/index.html", html.encode("utf-8"))
+
+        self.assets = built
+        return len(built)
+
+    @staticmethod
+    def _bundle_scripts(html, sources):
+        parts = []
+        first = None
+        for m in SCRIPT_TAG_RE.finditer(html):
+            body = sources.get("/" + m.group("path").lstrip("/"))
+            if body is None:
+                continue
+            if first is None:
+                first = m
+            parts.append(b"/* " + m.group("path").encode("utf-8") + b" */\n" + body.rstrip() + b"\n;\n")
+        if not parts:
+            return html, None
+
+        indent = re.match(r"[ \t]*", first.group(0)).group(0)
+        placeholder = "\0bundle\0"
+
+        def drop(m):
+            if ("/" + m.group("path").lstrip("/")) not in sources:
+                return m.group(0)
+            return placeholder if m.start() == first.start() else ""
+
+        html = SCRIPT_TAG_RE.sub(drop, html)
+        html = html.replace(placeholder, f'{indent}<script src="{BUNDLE_PATH.lstrip("/")}"></script>\n', 1)
+        return html, b"".join(parts)
+
+    @staticmethod
+    def _version_refs(html, assets):
+        def repl(m):
+            asset = assets.get("/" + m.group("path").lstrip("/"))
+            if asset is None:
+                return m.group(0)
+            return f'{m.group("attr")}="{m.group("path")}?v={asset.version}"'
+        return ASSET_REF_RE.sub(repl, html)
+
+    def lookup(self, url_path):
+        path = unquote(url_path.split("?", 1)[0].split("#", 1)[0])
+        if path == "/":
+            path = "/index.html"
+        return self.assets.get(path)
+
+    @staticmethod
+    def pick_encoding(asset, accept_encoding):
+        """Return (body, content-encoding or None) for the client's Accept-Encoding"""
+        accepted = set()
+        for token in (accept_encoding or "").split(","):
+            name, _, params = token.strip().partition(";")
+            if params.strip().replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+                continue
+            accepted.add(name.strip().lower())
+        if asset.br is not None and "br" in accepted:
+            return asset.br, "br"
+        if asset.gzip is not None and ("gzip" in accepted or "*" in accepted):
+            return asset.gzip, "gzip"
+        return asset.body, None
+
+    @staticmethod
+    def cache_control(asset, query):
+        if f"v={asset.version}" in (query or "").split("&"):
+            return LONG_CACHE
+        return "no-cache"
@@ -32,7 +32,112 @@ async function init() {
             if (['height','max-height','opacity'].includes(e.propertyName)) scheduleRedraw();
         });
     }
-    setInterval(checkStatus, 3000);
+    connectEvents();
+}
+
+// --- Live Events ---
+// One long-lived SSE stream replaces status/log polling; polling is only the fallback
+const STATUS_POLL_INTERVAL_MS = 3000;
+const CLIENT_ID = Math.random().toString(36).slice(2, 10);
+let statusPollTimer = null;
+let eventSource = null;
+
+function startStatusPolling() {
+    if (!statusPollTimer) statusPollTimer = setInterval(checkStatus, STATUS_POLL_INTERVAL_MS);
+}
+
+function stopStatusPolling() {
+    if (statusPollTimer) clearInterval(statusPollTimer);
+    statusPollTimer = null;
+}
+
+function setCoreButton(running) {
+    const btn = document.getElementById('btn-start');
+    if (!btn) return;
+    btn.className = running ? 'btn-danger' : 'btn-success';
+    btn.querySelector('span').textContent = running ? 'Stop Core' : 'Start Core';
+    if (!running && Object.keys(appState.traffic).length > 0) {
+        appState.traffic = {};
+        renderTrafficOverlay();
+    }
+}
+
+// Background core install: log each stage once and download progress in 25% steps
+let lastInstallStep = null;
+function showInstallStatus(d) {
+    if (!d || !d.state || d.state === 'idle') return;
+    let step = `${d.state}:${d.stage}`;
+    if (d.stage === 'downloading' && d.total) step += `:${Math.floor(d.received / d.total * 4)}`;
+    if (step === lastInstallStep) return;
+    lastInstallStep = step;
+    if (d.state === 'failed') {
+        log(`sing-box install failed: ${d.error}`, 'error');
+    } else if (d.state === 'done') {
+        log(`sing-box ${d.version} installed`, 'success');
+    } else if (d.stage === 'downloading' && d.total) {
+        log(`Downloading sing-box ${d.version}: ${Math.round(d.received / d.total * 100)}%`, 'info', { toast: false });
+    } else {
+        log(`Installing sing-box ${d.version}: ${d.stage}...`, 'info', { toast: false });
+    }
+}
+
+function connectEvents() {
+    if (typeof EventSource === 'undefined') {
+        startStatusPolling();
+        return;
+    }
+    eventSource = new EventSource(`${API_URL}/events`);
+    const on = (name, handler) => eventSource.addEventListener(name, (e) => {
+        try { handler(JSON.parse(e.data)); } catch (err) { console.error(`Bad ${name} event:`, err); }
+    });
+
+    eventSource.addEventListener('open', stopStatusPolling);
+    // EventSource reconnects on its own; poll meanwhile so the UI stays current
+    eventSource.addEventListener('error', startStatusPolling);
+
+    on('hello', (d) => {
+        if (!isProcessing) setCoreButton(d.core.running);
+        showInstallStatus(d.install);
+    });
+    on('install', showInstallStatus);
+    // The editor drives the default instance; other instances only get a status line
+    const isOtherInstance = (d) => d.instance && d.instance !== 'default';
+    on('core', (d) => {
+        if (isOtherInstance(d)) {
+            if (d.reason === 'started' || d.reason === 'exited') {
+                log(`Instance ${d.instance} ${d.reason === 'started' ? 'started' : `exited (code ${d.exit_code})`}`,
+                    d.reason === 'exited' ? 'warning' : 'info', { toast: false });
+            }
+            return;
+        }
+        if (!isProcessing) setCoreButton(d.running);
+        if (d.reason === 'exited') {
+            log(`Core exited unexpectedly (code ${d.exit_code})`, 'error');
+        }
+    });
+    on('log', (d) => {
+        if (!isOtherInstance(d)) displayCoreLogLine(d.line);
+    });
+    on('rr', (d) => {
+        if (isOtherInstance(d)) return;
+        if (d.groups && d.groups.length > 0) {
+            log(`Round-robin helpers: ${d.groups.map(g => `${g.id} :${g.listen_port} (${g.balance})`).join(', ')}`, 'info', { toast: false });
+        }
+    });
+    on('rr_eject', (d) => {
+        if (isOtherInstance(d)) return;
+        log(`Round-robin group ${d.group}: backend ${d.backend} unreachable, skipped for ${d.seconds}s`, 'warning', { toast: false });
+    });
+    on('config', (d) => {
+        if (d.origin === CLIENT_ID) return;
+        log(`Config ${d.status === 'success' ? 'saved' : 'rejected'} in another window: ${d.message}`,
+            d.status === 'success' ? 'info' : 'error', { toast: false });
+    });
+    on('traffic', (d) => {
+        if (isOtherInstance(d)) return;
+        appState.traffic = d.outbounds || {};
+        renderTrafficOverlay();
+    });
 }
 
 // --- Persistence ---
@@ -118,24 +223,37 @@ async function flushAutoConfigSave() {
     return await runAutoConfigSave({ force: false });
 }
 
+// Profile sections as last stored on the server, so saves only send what changed
+const PROFILE_SECTIONS = ['layers', 'nodeLibrary', 'inbounds'];
+let savedProfileSections = {};
+
+function snapshotProfileSections() {
+    const snapshot = {};
+    PROFILE_SECTIONS.forEach(key => { snapshot[key] = JSON.stringify(appState[key]); });
+    return snapshot;
+}
+
 async function saveCurrentProfile() {
     if (!appState.currentProfile) return;
     normalizeTopology();
-    try {
-        const res = await fetch(`${API_URL}/profiles/save`, { 
-            method: 'POST', 
-            headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({ 
-                name: appState.currentProfile, 
-                content: { 
-                    layers: appState.layers, 
-                    nodeLibrary: appState.nodeLibrary,
-                    inbounds: appState.inbounds
-                } 
-            }) 
-        });
-        if (!res.ok) throw new Error(`HTTP ${res.status}`);
-    } catch(e) { log("Save failed: " + e.message, "error"); }
+    const name = appState.currentProfile;
+    const snapshot = snapshotProfileSections();
+    const sections = {};
+    PROFILE_SECTIONS.forEach(key => {
+        if (savedProfileSections[key] !== snapshot[key]) sections[key] = appState[key];
+    });
+    if (Object.keys(sections).length) {
+        try {
+            const res = await fetch(`${API_URL}/profiles/patch`, {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({ name, sections })
+            });
+            const data = await res.json().catch(() => ({}));
+            if (!res.ok || data.status === 'error') throw new Error(data.message || `HTTP ${res.status}`);
+            if (appState.currentProfile === name) savedProfileSections = snapshot;
+        } catch(e) { log("Save failed: " + e.message, "error"); }
+    }
     scheduleAutoConfigSave();
 }
 
@@ -146,10 +264,16 @@ async function refreshProfileList() {
         const data = await res.json();
         const list = document.getElementById('profile-list');
         list.innerHTML = '';
+        const meta = new Map((data.items || []).map(item => [item.name, item]));
         if (data.profiles) data.profiles.forEach(f => {
             const li = document.createElement('li');
             li.textContent = f.replace('.json', '');
             li.setAttribute('data-name', f);
+            const info = meta.get(f);
+            if (info) {
+                const modified = info.modified ? new Date(info.modified * 1000).toLocaleString() : 'unknown';
+                li.title = `${info.nodes} nodes · ${info.placed} placed · ${info.layers} hops · modified ${modified}`;
+            }
             li.onclick = () => loadProfile(f);
             if(appState.currentProfile === f) li.classList.add('active');
             const del = document.createElement('span'); del.innerHTML='×'; del.style.cssText='float:right;color:#ef4444;cursor:pointer';
@@ -162,7 +286,8 @@ async function refreshProfileList() {
 
 async function loadProfile(f) {
     try {
-        const res = await fetch(`${API_URL}/profiles/load?name=${encodeURIComponent(f)}`);
+        // 'no-cache' revalidates via ETag, so unchanged profiles come back as 304 from the browser cache
+        const res = await fetch(`${API_URL}/profiles/load?name=${encodeURIComponent(f)}`, { cache: 'no-cache' });
         const data = await res.json();
         if (data.status === 'success') {
             const raw = data.data || {};
@@ -175,6 +300,8 @@ async function loadProfile(f) {
             appState.layers = raw.layers;
             appState.inbounds = raw.inbounds;
             appState.nodeLibrary = raw.nodeLibrary;
+            appState.probeSelection = [];
+            savedProfileSections = snapshotProfileSections();
 
             if (!appState.nodeLibrary.find(n => n && n.tag === 'direct')) {
                 appState.nodeLibrary.push({ id: 'lib-direct', tag: 'direct', type: 'direct' });
@@ -255,16 +382,134 @@ async function deleteProfile(f) {
     log(`Deleted ${f}`, "success");
 }
 
+// --- Node Probing ---
+const PROBE_POLL_INTERVAL_MS = 1000;
+let probePollTimer = null;
+
+function getProbeNodes() {
+    return (appState.nodeLibrary || []).filter(n => n && n.tag && n.tag !== 'direct');
+}
+
+function getSelectedProbeNodes() {
+    const nodes = getProbeNodes();
+    const picked = new Set(appState.probeSelection);
+    const selected = nodes.filter(n => picked.has(n.tag));
+    return selected.length ? selected : nodes;
+}
+
+// Empty means the server's default target
+function getProbeTarget() {
+    const input = document.getElementById('probe-target');
+    return (input && input.value.trim()) || undefined;
+}
+
+function toggleProbeSelection(tag, on) {
+    const picked = new Set(appState.probeSelection);
+    if (on) picked.add(tag); else picked.delete(tag);
+    appState.probeSelection = Array.from(picked);
+    updateProbeButton();
+}
+
+function updateProbeButton() {
+    const btn = document.getElementById('probe-btn');
+    if (!btn) return;
+    const tags = new Set(getProbeNodes().map(n => n.tag));
+    const count = appState.probeSelection.filter(t => tags.has(t)).length;
+    btn.textContent = count ? `⏱ Probe (${count})` : '⏱ Probe';
+}
+
+async function probeLibraryNodes() {
+    const nodes = getSelectedProbeNodes();
+    if (nodes.length === 0) {
+        log("No library nodes to probe", "error");
+        return;
+    }
+    try {
+        const res = await fetch(`${API_URL}/probe/start`, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ nodes, target: getProbeTarget() })
+        });
+        const data = await res.json();
+        if (data.status !== 'success') throw new Error(data.message || 'Probe failed');
+        log(data.message, "info");
+        if (probePollTimer) clearTimeout(probePollTimer);
+        probePollTimer = setTimeout(pollProbeResults, PROBE_POLL_INTERVAL_MS);
+    } catch (e) {
+        log(`Probe failed: ${e.message}`, "error");
+    }
+}
+
+async function fetchProbeResults() {
+    const res = await fetch(`${API_URL}/probe/results`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ nodes: getProbeNodes(), target: getProbeTarget() })
+    });
+    const data = await res.json();
+    appState.probeResults = data.results || {};
+    renderNodeLibrary();
+    return data;
+}
+
+// Shows the cached results for the current target without logging
+async function refreshProbeResults() {
+    try {
+        await fetchProbeResults();
+    } catch (e) {
+        log(`Probe results failed: ${e.message}`, "error");
+    }
+}
+
+async function pollProbeResults() {
+    probePollTimer = null;
+    try {
+        const data = await fetchProbeResults();
+        if (data.running) {
+            probePollTimer = setTimeout(pollProbeResults, PROBE_POLL_INTERVAL_MS);
+        } else if (data.error) {
+            log(`Probe failed: ${data.error}`, "error");
+        } else {
+            log(`Probe finished (${Object.keys(appState.probeResults).length} result(s))`, "success");
+        }
+    } catch (e) {
+        log(`Probe results failed: ${e.message}`, "error");
+    }
+}
+
+function setLibrarySort(mode) {
+    appState.librarySort = mode || 'default';
+    renderNodeLibrary();
+}
+
 // --- Deployment ---
 function buildSingboxConfig() {
     normalizeTopology();
     return ChainCore.buildSingboxConfig(appState, {
         resolveNodeDefinition,
         getNodeType,
-        log
+        log,
+        onReport: (report) => { lastBuildReport = report; }
     });
 }
 
+// Latest reachability report from ChainCore, logged with the config size when it changes
+let lastBuildReport = null;
+let lastBuildReportKey = null;
+function logBuildReport(bytes) {
+    const r = lastBuildReport;
+    if (!r) return;
+    const key = JSON.stringify([r.outbounds, r.inbounds, r.rules, r.pruned, r.prunedGroups]);
+    if (key === lastBuildReportKey) return;
+    lastBuildReportKey = key;
+    const pruned = [...r.pruned, ...r.prunedGroups];
+    let msg = `Config: ${r.outbounds} outbounds, ${r.inbounds} inbounds, ${r.rules} rules, ${(bytes / 1024).toFixed(1)} KB`;
+    if (pruned.length > 0) {
+        msg += `; pruned ${pruned.length} unreachable: ${pruned.slice(0, 10).join(', ')}${pruned.length > 10 ? ', ...' : ''}`;
+    }
+    log(msg, 'info', { toast: false });
+}
+
 function logValidationDetail(detail, status = 'info') {
     if (!detail) return;
     const type = status === 'error' ? 'error' : 'info';
@@ -274,16 +519,29 @@ function logValidationDetail(detail, status = 'info') {
     });
 }
 
+let lastPortConflictKey = null;
+function logPortReport(ports) {
+    if (!ports) return;
+    const conflicts = Array.isArray(ports.conflicts) ? ports.conflicts : [];
+    const key = JSON.stringify(conflicts);
+    if (key === lastPortConflictKey) return;
+    lastPortConflictKey = key;
+    conflicts.forEach(c => log(`Port ${c.port} (${c.tag}): ${c.reason}`, 'warning', { toast: false }));
+}
+
 async function saveConfigToServer(config, options = {}) {
     const { logDetail = true } = options;
+    const body = JSON.stringify(config);
+    logBuildReport(body.length);
     const res = await fetch(`${API_URL}/save_config`, {
         method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify(config)
+        headers: { 'Content-Type': 'application/json', 'X-Client-Id': CLIENT_ID },
+        body
     });
     const data = await res.json();
     const shouldLogDetail = logDetail || data.status !== 'success';
     if (shouldLogDetail && data.detail) logValidationDetail(data.detail, data.status === 'success' ? 'info' : 'error');
+    logPortReport(data.ports);
     if (data.status !== 'success') {
         const msg = data.message || 'Config save failed';
         throw new Error(msg);
@@ -340,7 +598,7 @@ async function exportConfig() {
 
     try {
         log("Generating sing-box config...", "info");
-        const config = buildSingboxConfig();
+        const config = ChainCore.stripBackendMeta(buildSingboxConfig());
 
         // Download as JSON file
         const configStr = JSON.stringify(config, null, 2);
@@ -413,17 +671,26 @@ async function checkStatus() {
     try {
         const res = await fetch(`${API_URL}/status`, { method: 'POST' });
         const data = await res.json();
-        const btn = document.getElementById('btn-start');
-        if(data.running) {
-            btn.className = 'btn-danger'; btn.querySelector('span').textContent = 'Stop Core';
+        setCoreButton(data.running);
+        // While the event stream is open, logs and traffic arrive through it
+        const streaming = eventSource && eventSource.readyState === EventSource.OPEN;
+        if(data.running && !streaming) {
             // fetch and display latest logs on each status poll
             await fetchAndDisplayLatestLogs();
-        } else {
-            btn.className = 'btn-success'; btn.querySelector('span').textContent = 'Start Core';
+            await fetchTraffic();
         }
     } catch(e) {}
 }
 
+async function fetchTraffic() {
+    try {
+        const res = await fetch(`${API_URL}/traffic`);
+        const data = await res.json();
+        appState.traffic = (data.available && data.outbounds) || {};
+        renderTrafficOverlay();
+    } catch(e) {}
+}
+
 let lastLogLineCount = 0;
 async function fetchAndDisplayLatestLogs() {
     try {
@@ -433,19 +700,7 @@ async function fetchAndDisplayLatestLogs() {
         if(data.logs && data.logs.length > lastLogLineCount) {
             // only show new log lines
             const newLogs = data.logs.slice(lastLogLineCount);
-            newLogs.forEach(l => {
-                const trimmed = l.trim();
-                if (trimmed) {
-                    // color by log level
-                    let logType = 'info';
-                    if (trimmed.includes('error') || trimmed.includes('ERROR') || trimmed.includes('failed')) {
-                        logType = 'error';
-                    } else if (trimmed.includes('warn') || trimmed.includes('WARN')) {
-                        logType = 'warning';
-                    }
-                    log(trimmed, logType, { toast: false });
-                }
-            });
+            newLogs.forEach(displayCoreLogLine);
             lastLogLineCount = data.logs.length;
         }
     } catch(e) {
@@ -453,4 +708,17 @@ async function fetchAndDisplayLatestLogs() {
     }
 }
 
+function displayCoreLogLine(line) {
+    const trimmed = String(line || '').trim();
+    if (!trimmed) return;
+    // color by log level
+    let logType = 'info';
+    if (trimmed.includes('error') || trimmed.includes('ERROR') || trimmed.includes('failed')) {
+        logType = 'error';
+    } else if (trimmed.includes('warn') || trimmed.includes('WARN')) {
+        logType = 'warning';
+    }
+    log(trimmed, logType, { toast: false });
+}
+
 // Exports
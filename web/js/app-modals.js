@@ -152,6 +152,27 @@ function updateFormFields() {
         if (['vmess', 'vless', 'hysteria2', 'trojan'].includes(type)) addField('UUID/Password', 'f-auth', nodeData.password || nodeData.uuid);
         if (type === 'hysteria2') addField('SNI', 'f-sni', nodeData.tls ? nodeData.tls.server_name : '');
     }
+
+    if (type === 'roundrobin') {
+        const group = document.createElement('div');
+        group.className = 'form-group';
+        const label = document.createElement('label');
+        label.textContent = 'Balancing';
+        const select = document.createElement('select');
+        select.id = 'f-balance';
+        [
+            ['roundrobin', 'Round robin (each connection)'],
+            ['sticky', 'Sticky (same site, same exit)']
+        ].forEach(([value, text]) => {
+            const opt = document.createElement('option');
+            opt.value = value;
+            opt.textContent = text;
+            select.appendChild(opt);
+        });
+        select.value = nodeData.balance || 'roundrobin';
+        group.append(label, select);
+        container.appendChild(group);
+    }
 }
 
 // Helper to remove link from modal
@@ -190,6 +211,8 @@ function saveNodeConfig() {
         else node.password = getVal('f-auth');
     }
     if (getVal('f-sni')) { if (!node.tls) node.tls = {enabled:true}; node.tls.server_name = getVal('f-sni'); }
+    if (node.type === 'roundrobin' && getVal('f-balance')) node.balance = getVal('f-balance');
+    else delete node.balance;
 
     if (node.tag === 'direct' || originalTag === 'direct') {
         log('The "direct" tag is reserved.', 'error');
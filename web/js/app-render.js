@@ -261,6 +261,35 @@ function render() {
     setTimeout(redraw, 60); // fallback in case of delayed fonts/layout
     updateConfigEditor();
     renderNodeLibrary();
+    renderTrafficOverlay();
+}
+
+function formatRate(bps) {
+    if (bps >= 1048576) return `${(bps / 1048576).toFixed(1)}M`;
+    if (bps >= 1024) return `${(bps / 1024).toFixed(1)}K`;
+    return `${bps}B`;
+}
+
+// Live per-node throughput/connections on layer cards, updated in place (no full re-render)
+function renderTrafficOverlay() {
+    const traffic = appState.traffic || {};
+    document.querySelectorAll('#nodes-layer .node-card[data-node-tag], #system-internet').forEach(el => {
+        const stats = traffic[el.dataset.nodeTag];
+        let badge = el.querySelector('.node-traffic');
+        if (!stats) {
+            if (badge) badge.remove();
+            return;
+        }
+        if (!badge) {
+            badge = document.createElement('div');
+            badge.className = 'node-traffic';
+            el.appendChild(badge);
+        }
+        badge.classList.toggle('idle', !stats.connections && !stats.up_bps && !stats.down_bps);
+        badge.textContent = `↓${formatRate(stats.down_bps || 0)} ↑${formatRate(stats.up_bps || 0)} · ${stats.connections || 0}c`;
+        badge.title = `${stats.connections || 0} active connection(s)\n` +
+            `Total ↓${formatRate(stats.download || 0)} ↑${formatRate(stats.upload || 0)}`;
+    });
 }
 
 function renderNodeLibrary() {
@@ -268,6 +297,8 @@ function renderNodeLibrary() {
     if (!listEl) return;
 
     listEl.replaceChildren();
+    // Ticked nodes may have been renamed or removed since the last render
+    updateProbeButton();
 
     if (!appState.nodeLibrary || appState.nodeLibrary.length === 0) {
         const li = document.createElement('li');
@@ -280,7 +311,26 @@ function renderNodeLibrary() {
         return;
     }
 
-    appState.nodeLibrary.forEach(node => {
+    const probeResults = appState.probeResults || {};
+    const probeScore = (tag) => {
+        const r = probeResults[tag];
+        if (!r || !r.ok) return null;
+        if (appState.librarySort === 'throughput') return -(r.throughput_kbps || 0);
+        return (r.connect_ms || 0) + (r.ttfb_ms || 0);
+    };
+    const libraryNodes = appState.nodeLibrary.slice();
+    if (appState.librarySort === 'latency' || appState.librarySort === 'throughput') {
+        libraryNodes.sort((a, b) => {
+            const sa = probeScore(a?.tag);
+            const sb = probeScore(b?.tag);
+            if (sa === null && sb === null) return 0;
+            if (sa === null) return 1;
+            if (sb === null) return -1;
+            return sa - sb;
+        });
+    }
+
+    libraryNodes.forEach(node => {
         if (!node || node.tag === 'direct') return;
         const li = document.createElement('li');
         li.className = 'node-lib-item';
@@ -303,7 +353,28 @@ function renderNodeLibrary() {
         typeEl.style.color = '#666';
         typeEl.style.marginTop = '2px';
         typeEl.textContent = node.type || 'unknown';
+        const probe = probeResults[node.tag];
+        if (probe) {
+            if (probe.ok) {
+                const latency = Math.round((probe.connect_ms || 0) + (probe.ttfb_ms || 0));
+                const mbps = ((probe.throughput_kbps || 0) / 1000).toFixed(1);
+                typeEl.textContent += ` · ${latency}ms · ${mbps}Mbps`;
+            } else {
+                typeEl.textContent += ' · ✗';
+                typeEl.title = probe.error || 'Probe failed';
+            }
+        }
         left.append(tagEl, typeEl);
+        left.style.flex = '1';
+        left.style.minWidth = '0';
+
+        const pick = document.createElement('input');
+        pick.type = 'checkbox';
+        pick.style.marginRight = '8px';
+        pick.title = 'Include in probe';
+        pick.checked = appState.probeSelection.includes(node.tag);
+        pick.addEventListener('click', (event) => event.stopPropagation());
+        pick.addEventListener('change', () => toggleProbeSelection(node.tag, pick.checked));
 
         const right = document.createElement('div');
         const editBtn = document.createElement('button');
@@ -326,7 +397,7 @@ function renderNodeLibrary() {
         });
 
         right.append(editBtn, delBtn);
-        row.append(left, right);
+        row.append(pick, left, right);
         li.appendChild(row);
         listEl.appendChild(li);
     });
@@ -8,6 +8,12 @@ let appState = {
     editingLayerId: null,
     nodePickerLayerId: null,
     editingInboundTag: null,
+    // Probe
+    probeResults: {}, // tag -> { ok, connect_ms, ttfb_ms, throughput_kbps, error }
+    probeSelection: [], // tags ticked for probing (none ticked = whole library)
+    librarySort: 'default', // 'default' | 'latency' | 'throughput'
+    // Live traffic (clash_api)
+    traffic: {}, // tag -> { connections, up_bps, down_bps, upload, download }
     // Config
     inbounds: [] // [{ tag:'mixed-10808', type:'mixed', port:10808, detours: [], selectorDefault:null }]
 };
@@ -82,7 +82,7 @@ function isConfigPanelOpen() {
 function updateConfigEditor() {
     if (!configEditor || !isConfigPanelOpen()) return;
     try {
-        const cfg = buildSingboxConfig();
+        const cfg = ChainCore.stripBackendMeta(buildSingboxConfig());
         configEditor.value = JSON.stringify(cfg, null, 2);
     } catch (e) {
         configEditor.value = `// Failed to build config\n${e.message}`;
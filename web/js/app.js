@@ -36,6 +36,9 @@
     window.restartCore = restartCore;
     window.exportConfig = exportConfig;
     window.toggleService = toggleService;
+    window.probeLibraryNodes = probeLibraryNodes;
+    window.refreshProbeResults = refreshProbeResults;
+    window.setLibrarySort = setLibrarySort;
 
     window.openImportModal = openImportModal;
     window.closeImportModal = closeImportModal;
@@ -1,5 +1,7 @@
 (() => {
 
+    const BACKEND_META_KEY = '_sys_rr';
+
     function sanitizeInboundDefaults(state) {
         if (!state || !state.inbounds) return;
         state.inbounds.forEach(ib => {
@@ -13,6 +15,57 @@
         });
     }
 
+    // Walks the outbound graph from the route's entry points with one iterative
+    // DFS, so it is O(outbounds + edges). Edges are detours, selector/urltest
+    // members and the extra edges given (an RR helper outbound to its backends).
+    function analyzeReachability(outbounds, roots, extraEdges = new Map()) {
+        const byTag = new Map(outbounds.map(o => [o.tag, o]));
+        const edgesOf = (tag) => {
+            const o = byTag.get(tag);
+            const edges = [];
+            if (o.detour) edges.push(o.detour);
+            if (Array.isArray(o.outbounds)) edges.push(...o.outbounds);
+            const extra = extraEdges.get(tag);
+            if (extra) edges.push(...extra);
+            return edges;
+        };
+
+        const DONE = -1;
+        const visit = new Map(); // tag -> index on the DFS stack while open, DONE once finished
+        const cycles = [];
+        const dangling = [];
+        roots.forEach(({ tag: root, from }) => {
+            if (!byTag.has(root)) {
+                dangling.push({ from, to: root });
+                return;
+            }
+            if (visit.has(root)) return;
+            const stack = [{ tag: root, edges: edgesOf(root), next: 0 }];
+            visit.set(root, 0);
+            while (stack.length > 0) {
+                const frame = stack[stack.length - 1];
+                if (frame.next >= frame.edges.length) {
+                    visit.set(frame.tag, DONE);
+                    stack.pop();
+                    continue;
+                }
+                const to = frame.edges[frame.next++];
+                if (!byTag.has(to)) {
+                    dangling.push({ from: frame.tag, to });
+                    continue;
+                }
+                const seen = visit.get(to);
+                if (seen === undefined) {
+                    visit.set(to, stack.length);
+                    stack.push({ tag: to, edges: edgesOf(to), next: 0 });
+                } else if (seen !== DONE) {
+                    cycles.push([...stack.slice(seen).map(f => f.tag), to]);
+                }
+            }
+        });
+        return { reachable: new Set(visit.keys()), cycles, dangling };
+    }
+
     function buildSingboxConfig(state, helpers = {}) {
         const resolveNodeDefinition = helpers.resolveNodeDefinition;
 
@@ -38,11 +91,13 @@
         let inbounds = [];
         const outboundMap = new Map();
         const usedTags = new Set();
+        // Preferred RR ports only: the server keeps them when free and reassigns them otherwise
         const RR = {
             baseListenPort: 25080,
             baseBackendPort: 25100,
             backendStride: 32,
-            prefix: 'sys-rr-'
+            prefix: 'sys-rr-',
+            balanceModes: ['roundrobin', 'sticky']
         };
 
         const fnv1a32 = (str) => {
@@ -111,8 +166,12 @@
                 const inboundTags = candidates.map((_, i) => `${baseTag}-in-${i}`);
                 const backendPorts = candidates.map((_, i) => backendBase + i);
 
+                const balance = RR.balanceModes.includes(def.balance) ? def.balance : 'roundrobin';
+
                 rrGroups.push({
                     id,
+                    tag,
+                    balance,
                     baseTag,
                     outboundTag,
                     listenPort,
@@ -204,14 +263,8 @@
                     // 获取目标节点的类型定义
                     const getTargetType = (targetTag) => {
                         // 首先检查是否在当前 layers 中定义
-                        for (const layer of layers) {
-                            for (const node of layer.nodes || []) {
-                                if (node.tag === targetTag) {
-                                    const def = (typeof resolveNodeDefinition === 'function' ? resolveNodeDefinition(node) : null) || node;
-                                    return def.type || node.type;
-                                }
-                            }
-                        }
+                        const placedType = getPlacedType(targetTag);
+                        if (placedType) return placedType;
                         // 然后检查 nodeLibrary
                         const libNode = state.nodeLibrary?.find(n => n.tag === targetTag);
                         if (libNode) {
@@ -247,7 +300,7 @@
             });
         });
 
-        const outbounds = Array.from(outboundMap.values());
+        let outbounds = Array.from(outboundMap.values());
 
         if (!usedTags.has('direct') && !outbounds.find(o => o.tag === 'direct')) {
             outbounds.push({ type: 'direct', tag: 'direct' });
@@ -297,7 +350,28 @@
             });
         }
 
-        rrGroups.forEach(g => {
+        // Only outbounds some inbound can reach are emitted; 'direct' always stays
+        const roots = routeRules.map(r => ({ tag: r.outbound, from: r.inbound[0] }));
+        if (routeRules.length < (state?.inbounds || []).length && outbounds.length > 0) {
+            // An inbound without a detour uses the default (first) outbound
+            roots.push({ tag: outbounds[0].tag, from: null });
+        }
+        const rrEdges = new Map(rrGroups.map(g => [g.outboundTag, g.candidates.map(mapTag)]));
+        const { reachable, cycles, dangling } = analyzeReachability(outbounds, roots, rrEdges);
+        if (cycles.length > 0) {
+            throw new Error(`Detour loop: ${cycles[0].join(' -> ')}`);
+        }
+        if (dangling.length > 0) {
+            const d = dangling[0];
+            throw new Error(`"${d.from || 'route'}" points to "${d.to}", which is not in any layer.`);
+        }
+        const keep = (o) => reachable.has(o.tag) || o.tag === 'direct';
+        const pruned = outbounds.filter(o => !keep(o)).map(o => o.tag);
+        const totalOutbounds = outbounds.length;
+        outbounds = outbounds.filter(keep);
+        const liveGroups = rrGroups.filter(g => reachable.has(g.outboundTag));
+
+        liveGroups.forEach(g => {
             g.inboundTags.forEach((inTag, i) => {
                 inbounds.push({
                     type: 'socks',
@@ -315,7 +389,7 @@
             });
         });
 
-        return {
+        const config = {
             log: { level: "info", timestamp: true },
             inbounds,
             outbounds,
@@ -326,10 +400,41 @@
                 ]
             }
         };
+
+        if (liveGroups.length > 0) {
+            // Backend-only settings for the RR helper; the server strips this key before sing-box sees it
+            const groups = {};
+            liveGroups.forEach(g => {
+                groups[g.id] = { tag: g.tag, balance: g.balance, backends: g.candidates };
+            });
+            config[BACKEND_META_KEY] = { groups };
+        }
+
+        if (typeof helpers.onReport === 'function') {
+            helpers.onReport({
+                outbounds: outbounds.length,
+                totalOutbounds,
+                inbounds: inbounds.length,
+                rules: config.route.rules.length,
+                pruned: pruned.filter(t => !t.startsWith(RR.prefix)),
+                prunedGroups: rrGroups.filter(g => !liveGroups.includes(g)).map(g => g.tag)
+            });
+        }
+
+        return config;
+    }
+
+    function stripBackendMeta(config) {
+        if (!config || !(BACKEND_META_KEY in config)) return config;
+        const copy = { ...config };
+        delete copy[BACKEND_META_KEY];
+        return copy;
     }
 
     window.ChainCore = {
         sanitizeInboundDefaults,
-        buildSingboxConfig
+        analyzeReachability,
+        buildSingboxConfig,
+        stripBackendMeta
     };
 })();